@@ -1,6 +1,7 @@
 import requests
 import time
 import json
+from requests.adapters import HTTPAdapter
 
 class NSEHistoricalAPI:
     def __init__(self):
@@ -14,8 +15,13 @@ class NSEHistoricalAPI:
             "Referer": "www.nseindia.com",
             "Connection": "keep-alive"
         }
+        # One keep-alive session for every call; the pool is sized for callers
+        # hitting it from several threads at once (e.g. the TV data bridge)
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def _init_session(self):
         """Step 1: Hit homepage to get valid cookies if session is new."""
@@ -27,12 +33,12 @@ class NSEHistoricalAPI:
             except Exception as e:
                 print(f"Failed to initialize session: {e}")
 
-    def _make_get_request(self, url, params=None):
-        """Helper method for making authenticated GET requests."""
+    def _make_get_request(self, url, params=None, headers=None):
+        """Helper method for making authenticated GET requests (headers: per-request extras)."""
         self._init_session()
         time.sleep(0.5) # Be kind to their servers
         try:
-            response = self.session.get(url, params=params, timeout=10)
+            response = self.session.get(url, params=params, headers=headers, timeout=10)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.HTTPError as e:
@@ -75,11 +81,10 @@ class NSEHistoricalAPI:
         url = f"{self.base_url}/api/option-chain-v3"
         params = {"type": instrument_type, "symbol": symbol}
         
-        headers = self.headers.copy()
-        headers["Referer"] = f"{self.base_url}/get-quotes/derivatives?symbol={symbol}"
-        self.session.headers.update(headers)
+        # Per-request Referer - the shared session headers stay untouched
+        headers = {"Referer": f"{self.base_url}/get-quotes/derivatives?symbol={symbol}"}
         
-        return self._make_get_request(url, params=params)
+        return self._make_get_request(url, params=params, headers=headers)
 
     def get_market_breadth(self):
         """
@@ -88,10 +93,8 @@ class NSEHistoricalAPI:
         """
         url = f"{self.base_url}/api/live-analysis-advance"
         # The referer might need to be specific for live data
-        headers = self.headers.copy()
-        headers["Referer"] = f"{self.base_url}/market-data/live-equity-market"
-        self.session.headers.update(headers)
-        return self._make_get_request(url)
+        headers = {"Referer": f"{self.base_url}/market-data/live-equity-market"}
+        return self._make_get_request(url, headers=headers)
 
     def get_expiry_dates(self, instrument_type, symbol, year):
         """
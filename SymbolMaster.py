@@ -30,10 +30,30 @@ Version: 1.0
 """
 
 import requests
-import gzip
-import io
-import pandas as pd
+import functools
+import json
 import os
+import pickle
+import shutil
+import time
+
+# Optional accelerators - both are drop-in and fall back to the stdlib
+try:
+    from isal import igzip as gzip_mod
+except ImportError:
+    import gzip as gzip_mod
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_upstox_key(symbol):
+    """Cached symbol -> key lookup; cleared whenever the mappings are reloaded."""
+    # Feeds mostly send upper-case symbols already - skip allocating a copy
+    return SymbolMaster._mappings.get(symbol if symbol.isupper() else symbol.upper())
 
 class SymbolMaster:
     _instance = None
@@ -41,6 +61,12 @@ class SymbolMaster:
     _reverse_mappings = {} # { "NSE_EQ|INE002A01018": "RELIANCE" }
     _initialized = False
 
+    CACHE_FILE = "upstox_instruments.json.gz"
+    MAPPINGS_CACHE_FILE = "upstox_instruments.pkl"
+    META_FILE = "upstox_instruments.meta.json"  # Last-Modified / ETag of CACHE_FILE
+    MAPPINGS_MAX_AGE_HOURS = 24
+    IO_BUFFER_SIZE = 128 * 1024  # 128 KiB chunks for download copy and gzip reads
+
     def __new__(cls):
         """Singleton pattern implementation."""
         if cls._instance is None:
@@ -52,6 +78,10 @@ class SymbolMaster:
         Downloads and parses the Upstox NSE instrument master.
         
         This method is idempotent - subsequent calls are no-ops.
+        Decoded mappings younger than MAPPINGS_MAX_AGE_HOURS are loaded
+        straight from the pickle cache, skipping download and parsing.
+        Otherwise the download is a conditional GET; on 304 Not Modified
+        the existing cache is reused.
         Attempts to load from disk cache first if download fails.
         
         Raises:
@@ -60,37 +90,60 @@ class SymbolMaster:
         if self._initialized:
             return
             
-        cache_file = "upstox_instruments.json.gz"
-        content = None
+        cache_file = self.CACHE_FILE
+        
+        # 0. Reuse mappings decoded by a previous run (changes at most daily)
+        if self._load_mappings_cache():
+            print(f"[SymbolMaster] Loaded {len(self._mappings)} keys from {self.MAPPINGS_CACHE_FILE}")
+            _resolve_upstox_key.cache_clear()
+            self._initialized = True
+            return
         
         # 1. Try to Download
         try:
             print("[SymbolMaster] Initializing Instrument Keys...")
             url = "https://assets.upstox.com/market-quote/instruments/exchange/NSE.json.gz"
-            response = requests.get(url, timeout=60)
-            response.raise_for_status()
-            content = response.content
+            headers = self._conditional_headers(cache_file)
+            with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+                not_modified = response.status_code == 304
+                if not not_modified:
+                    response.raise_for_status()
+                    # Stream the compressed body straight to the cache file
+                    # instead of buffering the whole response in memory
+                    response.raw.decode_content = False
+                    tmp_file = cache_file + ".tmp"
+                    with open(tmp_file, "wb") as f:
+                        shutil.copyfileobj(response.raw, f, self.IO_BUFFER_SIZE)
+                    os.replace(tmp_file, cache_file)
+                    self._save_download_meta(response.headers)
             
-            # Save to cache
-            with open(cache_file, "wb") as f:
-                f.write(content)
-            print(f"  ✓ Downloaded and cached to {cache_file}")
+            if not_modified:
+                print(f"  ✓ Not modified, using {cache_file}")
+                # Same file as last time - the decoded pickle is still valid
+                if self._load_mappings_cache(max_age_hours=None):
+                    os.utime(self.MAPPINGS_CACHE_FILE)
+                    print(f"[SymbolMaster] Loaded {len(self._mappings)} keys from {self.MAPPINGS_CACHE_FILE}")
+                    _resolve_upstox_key.cache_clear()
+                    self._initialized = True
+                    return
+            else:
+                print(f"  ✓ Downloaded and cached to {cache_file}")
             
         except Exception as e:
             print(f"  [WARN] Download failed: {e}")
             # 2. Fallback to Disk Cache
             if os.path.exists(cache_file):
                 print(f"  [INFO] Loading from disk cache: {cache_file}")
-                with open(cache_file, "rb") as f:
-                    content = f.read()
             else:
                 print("  ✗ No disk cache available.")
                 raise e
         
         # 3. Parse content
         try:
-            with gzip.GzipFile(fileobj=io.BytesIO(content)) as f:
-                df = pd.read_json(f)
+            # Plain list of dicts - no DataFrame, we only need two columns
+            with open(cache_file, "rb", buffering=self.IO_BUFFER_SIZE) as raw, \
+                    gzip_mod.GzipFile(fileobj=raw, mode="rb") as f:
+                records = json_loads(f.read())
             
             # 2. Filter for Equities and Indices
             # Equities have lot_size=1 usually, Indices have specific names
@@ -99,34 +152,106 @@ class SymbolMaster:
             # Create Fast Lookup
             # "RELIANCE" -> "NSE_EQ|INE..."
             # "NIFTY 50" -> "NSE_INDEX|Nifty 50"
-            
-            # Optimization: Filter for Equities and Indices using 'segment'
-            # Segments found: 'NSE_EQ', 'NSE_INDEX'
-            df_filtered = df[df['segment'].isin(['NSE_EQ', 'NSE_INDEX'])].copy()
-            
-            for _, row in df_filtered.iterrows():
+            for r in records:
+                # Segments found: 'NSE_EQ', 'NSE_INDEX'
+                segment = r.get('segment')
+                if segment != 'NSE_EQ' and segment != 'NSE_INDEX':
+                    continue
+                
                 # Clean name: "Nifty 50" -> "NIFTY", "RELIANCE" -> "RELIANCE"
                 # Some might be "RELIANCE-EQ" or similar, usually trading_symbol is clean for equities
-                name = row['trading_symbol'].upper() 
-                key = row['instrument_key'] 
+                trading_symbol = r['trading_symbol']
+                name = trading_symbol.upper()
+                key = r['instrument_key']
                 
                 self._mappings[name] = key
                 self._reverse_mappings[key] = name
                 
                 # Special Handling for Indices (trading_symbol might be specific)
                 # For NSE_INDEX, name is often "Nifty 50", trading_symbol "Nifty 50"
-                if row['segment'] == 'NSE_INDEX':
-                    if row['name'] == "Nifty 50" or row['trading_symbol'] == "Nifty 50":
+                if segment == 'NSE_INDEX':
+                    index_name = r.get('name')
+                    if index_name == "Nifty 50" or trading_symbol == "Nifty 50":
                         self._mappings["NIFTY"] = key
-                    elif row['name'] == "Nifty Bank" or row['trading_symbol'] == "Nifty Bank":
+                    elif index_name == "Nifty Bank" or trading_symbol == "Nifty Bank":
                         self._mappings["BANKNIFTY"] = key
 
             print(f"[SymbolMaster] Loaded {len(self._mappings)} keys.")
+            _resolve_upstox_key.cache_clear()
             self._initialized = True
+            self._save_mappings_cache()
             
         except Exception as e:
             print(f"[SymbolMaster] Initialization Failed: {e}")
 
+    def _conditional_headers(self, cache_file):
+        """
+        Builds If-Modified-Since / If-None-Match headers for the cached download.
+        
+        Returns:
+            dict: Request headers (empty when there is nothing cached to validate)
+        """
+        if not os.path.exists(cache_file):
+            return {}
+        try:
+            with open(self.META_FILE, "rb") as f:
+                meta = json_loads(f.read())
+        except Exception:
+            return {}
+        
+        headers = {}
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        return headers
+
+    def _save_download_meta(self, response_headers):
+        """Remembers the validators of the downloaded file for the next conditional GET."""
+        meta = {
+            'last_modified': response_headers.get('Last-Modified'),
+            'etag': response_headers.get('ETag'),
+        }
+        try:
+            with open(self.META_FILE, "w") as f:
+                json.dump(meta, f)
+        except Exception as e:
+            print(f"  [WARN] Could not write {self.META_FILE}: {e}")
+
+    def _load_mappings_cache(self, max_age_hours=MAPPINGS_MAX_AGE_HOURS):
+        """
+        Loads the pickled mappings if the cache file is fresh enough.
+        
+        Args:
+            max_age_hours (float): Maximum cache age, or None to accept any age
+            
+        Returns:
+            bool: True if the mappings were loaded from the cache
+        """
+        path = self.MAPPINGS_CACHE_FILE
+        try:
+            age = time.time() - os.path.getmtime(path)
+            if max_age_hours is not None and age > max_age_hours * 3600:
+                return False
+            with open(path, "rb") as f:
+                mappings, reverse_mappings = pickle.loads(f.read())
+        except Exception:
+            return False
+        
+        self._mappings.update(mappings)
+        self._reverse_mappings.update(reverse_mappings)
+        return True
+
+    def _save_mappings_cache(self):
+        """Persists the decoded mappings so the next start can skip parsing."""
+        try:
+            payload = pickle.dumps((self._mappings, self._reverse_mappings),
+                                   protocol=pickle.HIGHEST_PROTOCOL)
+            with open(self.MAPPINGS_CACHE_FILE, "wb") as f:
+                f.write(payload)
+        except Exception as e:
+            print(f"  [WARN] Could not write {self.MAPPINGS_CACHE_FILE}: {e}")
+
     def get_upstox_key(self, symbol):
         """
         Resolves a trading symbol to its Upstox instrument key.
@@ -144,14 +269,8 @@ class SymbolMaster:
         if not self._initialized:
             self.initialize()
         
-        # 1. Direct Match
-        if symbol.upper() in self._mappings:
-            return self._mappings[symbol.upper()]
-        
-        # 2. Try adding -EQ extension common in some systems
-        # N/A for now
-        
-        return None
+        # 1. Direct Match (memoized - this sits on per-tick paths)
+        return _resolve_upstox_key(symbol)
 
     def get_ticker_from_key(self, key):
         """
@@ -1,78 +1,269 @@
 import re
+import os
+import mmap
+import codecs
+import numpy as np
 import pandas as pd
 import sqlite3
 import argparse
 
+# google-re2 is a linear-time DFA engine and much faster than the backtracking
+# stdlib engine on large logs; fall back to `re` when it is not installed
+try:
+    import re2 as regex
+except ImportError:
+    regex = re
+
+# ADBC hands back Arrow record batches that convert to pandas without boxing
+# every cell into a Python object; plain sqlite3 is the fallback
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+# Parsed signals are cached as parquet so re-analysing the same log skips
+# the parse; without pyarrow the log is parsed every run
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# fastnumbers ships a drop-in float() with a faster C parser for plain
+# decimals (same ValueError on bad input); the builtin is the fallback
+try:
+    from fastnumbers import float as fast_float
+except ImportError:
+    fast_float = float
+
+# Numba compiles the TP/SL scan into a single early-exit loop; without it the
+# numpy mask + argmax version is used
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Exit reason codes returned by first_exit
+NO_EXIT, TP_HIT, SL_HIT = 0, 1, 2
+
+# Each log gets its own cache next to it (backtest_java.log.signals.parquet)
+SIGNALS_CACHE_SUFFIX = ".signals.parquet"
+
+# Updated pattern for the new log format
+SIGNAL_PATTERN = regex.compile(r"SCALP SIGNAL \[(.*?)\] for (.*?): (.*?) \| Entry: ([\d\.]+) \| Stop: ([\d\.]+) \| Take Profit: ([\d\.]+) \| Position Size: ([\d\.]+)")
+
 def parse_log_file(log_path):
     signals = []
 
-    # Updated pattern for the new log format
-    signal_pattern = re.compile(r"SCALP SIGNAL \[(.*?)\] for (.*?): (.*?) \| Entry: ([\d\.]+) \| Stop: ([\d\.]+) \| Take Profit: ([\d\.]+) \| Position Size: ([\d\.]+)")
-
-    with open(log_path, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            match = signal_pattern.search(line)
-            if match:
-                signals.append({
-                    'Strategy': match.group(1),
-                    'Symbol': match.group(2),
-                    'Side': match.group(3),
-                    'Entry': float(match.group(4)),
-                    'SL': float(match.group(5)),
-                    'TP': float(match.group(6)),
-                    'PositionSize': float(match.group(7)),
-                })
+    # Map the file and decode it once, then let the regex engine scan the whole
+    # text in a single pass instead of decoding and searching line by line
+    with open(log_path, 'rb') as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                # Logs redirected from PowerShell are UTF-16 with a BOM
+                encoding = 'utf-16' if mm[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else 'utf-8'
+                text = mm[:].decode(encoding, errors='ignore')
+        except ValueError:  # empty files cannot be mapped
+            return signals
+
+    # Local bindings skip a global/attribute lookup per signal
+    _float = fast_float
+    _append = signals.append
+    for match in SIGNAL_PATTERN.finditer(text):
+        strategy, symbol, side, entry, sl, tp, size = match.groups()
+        _append({
+            'Strategy': strategy,
+            'Symbol': symbol,
+            'Side': side,
+            'Entry': _float(entry),
+            'SL': _float(sl),
+            'TP': _float(tp),
+            'PositionSize': _float(size),
+        })
 
     return signals
 
+def _signals_cache_key(log_path):
+    """Parquet metadata tying a signals cache to one log file and its mtime."""
+    return {b'source_log': os.path.abspath(log_path).encode(),
+            b'source_mtime_ns': str(os.stat(log_path).st_mtime_ns).encode()}
+
+def load_signals(log_path, cache_path=None):
+    """parse_log_file, reusing the parquet cache while it was built from this exact log."""
+    if pq is None:
+        return parse_log_file(log_path)
+
+    cache_path = cache_path or log_path + SIGNALS_CACHE_SUFFIX
+    key = _signals_cache_key(log_path)
+    try:
+        table = pq.read_table(cache_path)
+        metadata = table.schema.metadata or {}
+        # Another log (or a rewrite of this one) must not reuse the cache
+        if all(metadata.get(k) == v for k, v in key.items()):
+            return table.to_pylist()
+    except (OSError, pa.ArrowException):
+        pass  # missing or unreadable cache - parse again
+
+    signals = parse_log_file(log_path)
+    try:
+        table = pa.Table.from_pylist(signals)
+        pq.write_table(table.replace_schema_metadata(key), cache_path, compression='zstd')
+    except (OSError, pa.ArrowException) as e:
+        print(f"[WARN] Could not write {cache_path}: {e}")
+    return signals
+
 def load_candle_data(db_path, date):
+    # The date filter is a seek on the collector's idx_date_ts(date, timestamp, symbol)
+    query = "SELECT * FROM backtest_candles WHERE date = ?"
+
     conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query(f"SELECT * FROM backtest_candles WHERE date = '{date}'", conn)
-    conn.close()
+    try:
+        if adbc_sqlite is None:
+            # Bulk fetch: one C-level fetchall instead of pandas' per-row cursor iteration
+            cursor = conn.execute(query, (date,))
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+            df = pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        conn.close()
+
+    if adbc_sqlite is not None:
+        with adbc_sqlite.connect(db_path) as adbc_conn, adbc_conn.cursor() as cur:
+            cur.execute(query, (date,))
+            df = cur.fetch_arrow_table().to_pandas()
+
+    # A handful of repeated strings - integer codes are smaller and group faster.
+    # Prices stay float64: entries are matched on exact close equality.
+    df['symbol'] = df['symbol'].astype('category')
+    df['date'] = df['date'].astype('category')
     return df
 
+def _first_exit_numpy(highs, lows, tp, sl, is_long):
+    """Returns (index, reason code) of the first candle touching TP or SL, or (-1, NO_EXIT)."""
+    if is_long:
+        tp_hit = highs >= tp
+        sl_hit = lows <= sl
+    else: # SHORT
+        tp_hit = lows <= tp
+        sl_hit = highs >= sl
+
+    # TP wins when both levels are touched on the same candle
+    no_hit = len(highs)
+    first_tp = tp_hit.argmax() if tp_hit.any() else no_hit
+    first_sl = sl_hit.argmax() if sl_hit.any() else no_hit
+    if first_tp < no_hit and first_tp <= first_sl:
+        return first_tp, TP_HIT
+    if first_sl < no_hit:
+        return first_sl, SL_HIT
+    return -1, NO_EXIT
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def first_exit(highs, lows, tp, sl, is_long):
+        """Returns (index, reason code) of the first candle touching TP or SL, or (-1, NO_EXIT)."""
+        for i in range(highs.shape[0]):
+            if is_long:
+                if highs[i] >= tp:
+                    return i, TP_HIT
+                if lows[i] <= sl:
+                    return i, SL_HIT
+            else:
+                if lows[i] <= tp:
+                    return i, TP_HIT
+                if highs[i] >= sl:
+                    return i, SL_HIT
+        return -1, NO_EXIT
+
+    @njit(parallel=True, nogil=True, cache=True)
+    def scan_exits(highs, lows, starts, ends, tps, sls, is_long):
+        """Reason code for every signal; signals are independent so they run in parallel."""
+        codes = np.zeros(starts.shape[0], dtype=np.int8)
+        for i in prange(starts.shape[0]):
+            _, code = first_exit(highs[starts[i]:ends[i]], lows[starts[i]:ends[i]],
+                                 tps[i], sls[i], is_long[i])
+            codes[i] = code
+        return codes
+else:
+    first_exit = _first_exit_numpy
+
+    def scan_exits(highs, lows, starts, ends, tps, sls, is_long):
+        """Reason code for every signal."""
+        codes = np.zeros(starts.shape[0], dtype=np.int8)
+        for i in range(starts.shape[0]):
+            _, codes[i] = first_exit(highs[starts[i]:ends[i]], lows[starts[i]:ends[i]],
+                                     tps[i], sls[i], is_long[i])
+        return codes
+
 def simulate_trades(signals, candles_df):
     exits = []
 
+    # Sort each symbol's candles once and lay them end to end in shared
+    # high/low arrays; each symbol owns the slice [offset, end)
+    high_parts, low_parts = [], []
+    symbol_bounds = {}
+    # close price -> position of the first candle closing there, per symbol
+    entry_index = {}
+    offset = 0
+    for symbol, symbol_candles in candles_df.groupby('symbol', sort=False, observed=True):
+        symbol_candles = symbol_candles.sort_values('timestamp', kind='stable')
+        closes = symbol_candles['close'].to_numpy()
+        high_parts.append(symbol_candles['high'].to_numpy(dtype=np.float64))
+        low_parts.append(symbol_candles['low'].to_numpy(dtype=np.float64))
+        # Built back to front so duplicate closes keep the earliest position
+        n = len(closes)
+        entry_index[symbol] = dict(zip(closes[::-1].tolist(), range(n - 1, -1, -1)))
+        symbol_bounds[symbol] = (offset, offset + n)
+        offset += n
+
+    # Resolve each signal to its scan window, then scan all of them in one call
+    matched = []
+    starts, ends = [], []
     for signal in signals:
-        # Get the candles for the symbol after the signal
-        symbol_candles = candles_df[candles_df['symbol'] == signal['Symbol']].sort_values('timestamp')
+        if signal['Symbol'] not in symbol_bounds:
+            continue
+        symbol_start, symbol_end = symbol_bounds[signal['Symbol']]
 
         # Find the candle that generated the signal
-        entry_candle_index = symbol_candles[symbol_candles['close'] == signal['Entry']].index.min()
-
-        if pd.isna(entry_candle_index):
+        entry_candle_index = entry_index[signal['Symbol']].get(signal['Entry'])
+        if entry_candle_index is None:
             continue
 
-        trade_candles = symbol_candles[symbol_candles.index > entry_candle_index]
-
+        # Candles after the signal
+        matched.append(signal)
+        starts.append(symbol_start + entry_candle_index + 1)
+        ends.append(symbol_end)
+
+    if not matched:
+        return exits
+
+    codes = scan_exits(
+        np.concatenate(high_parts),
+        np.concatenate(low_parts),
+        np.array(starts, dtype=np.int64),
+        np.array(ends, dtype=np.int64),
+        np.array([signal['TP'] for signal in matched], dtype=np.float64),
+        np.array([signal['SL'] for signal in matched], dtype=np.float64),
+        np.array([signal['Side'] == 'LONG' for signal in matched], dtype=np.bool_),
+    )
+
+    for signal, code in zip(matched, codes.tolist()):
         pnl = 0
         reason = "NO_EXIT"
         exit_price = 0
 
-        for _, candle in trade_candles.iterrows():
+        if code == TP_HIT:
+            reason = "TP_HIT"
+            exit_price = signal['TP']
+        elif code == SL_HIT:
+            reason = "SL_HIT"
+            exit_price = signal['SL']
+
+        if reason != "NO_EXIT":
             if signal['Side'] == 'LONG':
-                if candle['high'] >= signal['TP']:
-                    pnl = (signal['TP'] - signal['Entry']) * signal['PositionSize']
-                    reason = "TP_HIT"
-                    exit_price = signal['TP']
-                    break
-                elif candle['low'] <= signal['SL']:
-                    pnl = (signal['SL'] - signal['Entry']) * signal['PositionSize']
-                    reason = "SL_HIT"
-                    exit_price = signal['SL']
-                    break
-            else: # SHORT
-                if candle['low'] <= signal['TP']:
-                    pnl = (signal['Entry'] - signal['TP']) * signal['PositionSize']
-                    reason = "TP_HIT"
-                    exit_price = signal['TP']
-                    break
-                elif candle['high'] >= signal['SL']:
-                    pnl = (signal['Entry'] - signal['SL']) * signal['PositionSize']
-                    reason = "SL_HIT"
-                    exit_price = signal['SL']
-                    break
+                pnl = (exit_price - signal['Entry']) * signal['PositionSize']
+            else:
+                pnl = (signal['Entry'] - exit_price) * signal['PositionSize']
 
         exits.append({
             'Side': signal['Side'],
@@ -97,7 +288,9 @@ def analyze_results(signals, exits):
         print("No trades completed.")
         return
 
-    df_exits['Gate'] = df_exits['GateKey']
+    # Gate keys are plain strategy names (no suffix parsing needed); categorical
+    # codes let the per-gate groupby hash small ints instead of strings
+    df_exits['Gate'] = df_exits['GateKey'].astype('category')
 
     # 1. Overall Performance
     total_pnl = df_exits['PnL'].sum()
@@ -116,8 +309,17 @@ def analyze_results(signals, exits):
     print("\n" + "="*40)
     print("PERFORMANCE BY STRATEGY (GATE)")
     print("="*40)
-    gate_stats = df_exits.groupby('Gate')['PnL'].agg(['count', 'sum', 'mean', 'min', 'max'])
-    gate_stats['WinRate'] = df_exits.groupby('Gate').apply(lambda x: (x['PnL'] > 0).sum() / len(x) * 100)
+    # Single fused aggregation - no Python callback per group
+    df_exits['_win'] = (df_exits['PnL'] > 0).astype(np.int8)
+    gate_stats = df_exits.groupby('Gate', observed=True).agg(
+        count=('PnL', 'size'),
+        sum=('PnL', 'sum'),
+        mean=('PnL', 'mean'),
+        min=('PnL', 'min'),
+        max=('PnL', 'max'),
+        WinRate=('_win', 'mean'),
+    )
+    gate_stats['WinRate'] *= 100
     print(gate_stats.sort_values(by='sum', ascending=False))
 
     # 3. Performance by Exit Reason
@@ -159,7 +361,7 @@ if __name__ == "__main__":
     db_file = "backtest_data.db"
 
     print(f"Analyzing {log_file}...")
-    signals = parse_log_file(log_file)
+    signals = load_signals(log_file)
 
     print(f"Loading candle data from {db_file}...")
     candles = load_candle_data(db_file, args.date)
@@ -3,11 +3,44 @@ Backfill historical option chain data from Trendlyne SmartOptions API.
 This populates a local SQLite database with 1-minute interval historical data.
 """
 import requests
+from requests.adapters import HTTPAdapter
 import time
 import sqlite3
 import os
+import sys
 import json
+import queue
+import asyncio
+import atexit
+import functools
+import logging
+import logging.handlers
+import threading
 from datetime import datetime, timedelta, date
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+import numpy as np
+
+# Log records are queued and written to stdout by a background thread, so the
+# backfill workers never block on console I/O. SCALP_LOG_LEVEL=WARNING hides
+# the per-slot progress lines.
+log = logging.getLogger("scalp")
+if not log.handlers:
+    _log_queue = queue.SimpleQueue()
+    _log_stream = logging.StreamHandler(sys.stdout)
+    _log_stream.setFormatter(logging.Formatter("%(message)s"))
+    _log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    log.addHandler(logging.handlers.QueueHandler(_log_queue))
+    log.propagate = False
+_log_level_name = os.environ.get("SCALP_LOG_LEVEL", "INFO").upper()
+_log_level = getattr(logging, _log_level_name, None)
+if not isinstance(_log_level, int):
+    # A typo in the environment must not break every importer - fall back to INFO
+    log.warning(f"[WARN] Invalid SCALP_LOG_LEVEL {_log_level_name!r}, using INFO")
+    _log_level = logging.INFO
+log.setLevel(_log_level)
 
 # Upstox SDK
 try:
@@ -17,21 +50,155 @@ try:
     UPSTOX_AVAILABLE = True
 except ImportError:
     UPSTOX_AVAILABLE = False
-    print("[WARN] Upstox SDK not found. Option Chain will rely on Trendlyne only.")
+    log.warning("[WARN] Upstox SDK not found. Option Chain will rely on Trendlyne only.")
+    
+# httpx + h2 multiplex all time-slot fetches over one HTTP/2 connection;
+# without them the backfill falls back to the threaded requests path
+try:
+    import httpx
+    import h2  # noqa: F401 - required by httpx for http2=True
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# orjson parses the option-chain payloads several times faster than stdlib json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
     
 from SymbolMaster import MASTER as SymbolMaster
 
 # ==========================================================================
 # 1. DATABASE LAYER (SQLite)
 # ==========================================================================
+# Statements are module constants so every call hands sqlite3 the identical
+# string and hits its prepared-statement cache instead of re-parsing
+SQL_INSERT_AGGREGATES = "INSERT OR REPLACE INTO option_aggregates VALUES (?, ?, ?, ?, ?, ?, ?)"
+SQL_INSERT_CHAIN_BLOB = "INSERT OR REPLACE INTO option_chain_blob VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+SQL_INSERT_BREADTH = "INSERT OR REPLACE INTO market_breadth VALUES (?, ?, ?, ?, ?, ?)"
+SQL_INSERT_PCR_HISTORY = "INSERT OR REPLACE INTO pcr_history VALUES (?, ?, ?, ?, ?)"
+SQL_LATEST_BREADTH = """SELECT date, timestamp, advances, declines, unchanged, total
+                        FROM market_breadth 
+                        ORDER BY date DESC, timestamp DESC LIMIT 1"""
+SQL_LATEST_AGGREGATES = """SELECT symbol, date, timestamp, expiry, call_oi, put_oi, pcr
+                           FROM option_aggregates 
+                           WHERE symbol=? 
+                           ORDER BY date DESC, timestamp DESC LIMIT 1"""
+SQL_LATEST_CHAIN_BLOB = """SELECT strikes, call_oi, put_oi, call_oi_chg, put_oi_chg
+                           FROM option_chain_blob 
+                           WHERE symbol=? 
+                           ORDER BY date DESC, timestamp DESC LIMIT 1"""
+# Snapshots written before option_chain_blob existed
+SQL_LATEST_CHAIN = """SELECT strike, call_oi, put_oi, call_oi_chg, put_oi_chg
+                      FROM option_chain_details 
+                      WHERE (symbol, date, timestamp) = (
+                          SELECT symbol, date, timestamp FROM option_chain_details 
+                          WHERE symbol=? 
+                          ORDER BY date DESC, timestamp DESC LIMIT 1)
+                      ORDER BY strike"""
+SQL_PCR_HISTORY = """SELECT symbol, date, pcr, call_oi, put_oi
+                     FROM pcr_history 
+                     WHERE symbol=? 
+                     ORDER BY date DESC LIMIT ?"""
+SQL_SNAPSHOT_TIMESTAMPS = "SELECT timestamp FROM option_aggregates WHERE symbol=? AND date=?"
+SQL_SYMBOL_META = "SELECT symbol, stock_id, expiry, expiry_fetched_at FROM symbol_meta WHERE symbol=?"
+SQL_UPSERT_STOCK_ID = """INSERT INTO symbol_meta (symbol, stock_id) VALUES (?, ?)
+                         ON CONFLICT(symbol) DO UPDATE SET stock_id=excluded.stock_id"""
+SQL_UPSERT_EXPIRY = """INSERT INTO symbol_meta (symbol, expiry, expiry_fetched_at) VALUES (?, ?, ?)
+                       ON CONFLICT(symbol) DO UPDATE SET expiry=excluded.expiry,
+                                                         expiry_fetched_at=excluded.expiry_fetched_at"""
+
+# Per-strike columns of a chain snapshot, in storage order
+CHAIN_COLUMNS = ('call_oi', 'put_oi', 'call_oi_chg', 'put_oi_chg')
+# Blob element types - fixed little-endian so the file is portable
+STRIKE_DTYPE = np.dtype('<f8')
+OI_DTYPE = np.dtype('<i8')
+# Snapshots a bulk load buffers before writing them in one short transaction
+BULK_FLUSH_SIZE = 60
+
+# OI blob schemes - stored in the first byte of every OI blob
+OI_SCHEME_RAW = 0           # plain OI_DTYPE values
+OI_SCHEME_DELTA_VARINT = 1  # zigzag varints of the strike-to-strike differences
+_VARINT_SHIFTS = np.arange(0, 64, 7, dtype=np.uint64)  # ten 7-bit groups cover 64 bits
+
+def _encode_oi(values):
+    """Packs an OI column as delta + zigzag varint bytes, prefixed by the scheme byte."""
+    deltas = np.diff(np.asarray(values, dtype=OI_DTYPE), prepend=0)
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).view(np.uint64)
+    
+    groups = (zigzag[:, None] >> _VARINT_SHIFTS) & 0x7f
+    # 7-bit groups needed per value - at least one, even for a zero delta
+    nonzero = groups != 0
+    lengths = np.where(nonzero.any(axis=1), len(_VARINT_SHIFTS) - nonzero[:, ::-1].argmax(axis=1), 1)
+    group_idx = np.arange(len(_VARINT_SHIFTS))
+    # Continuation bit on every group but the last of each value
+    groups |= (group_idx < (lengths - 1)[:, None]).astype(np.uint64) << np.uint64(7)
+    payload = groups[group_idx < lengths[:, None]].astype(np.uint8)
+    return bytes((OI_SCHEME_DELTA_VARINT,)) + payload.tobytes()
+
+def _decode_oi(blob):
+    """Inverse of _encode_oi; returns an OI_DTYPE array."""
+    scheme = blob[0]
+    if scheme == OI_SCHEME_RAW:
+        return np.frombuffer(blob, dtype=OI_DTYPE, offset=1)
+    if scheme != OI_SCHEME_DELTA_VARINT:
+        raise ValueError(f"Unknown OI blob scheme {scheme}")
+    
+    data = np.frombuffer(blob, dtype=np.uint8, offset=1)
+    if not data.size:
+        return np.zeros(0, dtype=OI_DTYPE)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # Position of every byte inside its varint gives its shift
+    value_idx = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = ((np.arange(data.size) - starts[value_idx]) * 7).astype(np.uint64)
+    zigzag = np.bitwise_or.reduceat((data & 0x7f).astype(np.uint64) << shifts, starts)
+    deltas = (zigzag >> np.uint64(1)).view(OI_DTYPE) ^ -(zigzag & np.uint64(1)).view(OI_DTYPE)
+    return np.cumsum(deltas)
+
+def _sort_by_strike(strikes, columns):
+    """Strike array and CHAIN_COLUMNS arrays reordered by ascending strike (no copy if already sorted)."""
+    strikes = np.asarray(strikes, dtype=STRIKE_DTYPE)
+    if np.all(strikes[:-1] <= strikes[1:]):
+        return strikes, list(columns)
+    # Stable, so duplicate strikes keep the order the API sent them in
+    order = np.argsort(strikes, kind='stable')
+    return strikes[order], [np.asarray(c)[order] for c in columns]
+
+def _chain_rows(strikes, columns):
+    """Per-strike dicts (get_latest_chain format) from the strike array and CHAIN_COLUMNS arrays."""
+    columns = [np.asarray(c).tolist() for c in columns]
+    return [dict(zip(('strike',) + CHAIN_COLUMNS, r))
+            for r in zip(np.asarray(strikes, dtype=STRIKE_DTYPE).tolist(), *columns)]
+
 class OptionDatabase:
     def __init__(self, db_path="options_data.db"):
         self.db_path = db_path
         self._init_db()
 
     def _init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # One long-lived connection shared by all callers (bridge threads included).
+        # Autocommit mode - multi-statement writes use explicit BEGIN/COMMIT.
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                                    cached_statements=256)
+        self.conn.executescript("""PRAGMA journal_mode=WAL;
+                                   PRAGMA synchronous=NORMAL;
+                                   PRAGMA temp_store=MEMORY;
+                                   PRAGMA cache_size=-64000;
+                                   PRAGMA mmap_size=268435456;""")
+        self._lock = threading.Lock()
+        self._closed = False
+        self._in_bulk = False
+        self._bulk_rows = []  # (aggregates row, chain blob row) awaiting a bulk flush
+        atexit.register(self.close)
+
+        cursor = self.conn.cursor()
+        # No secondary indexes: the (symbol, date, timestamp[, strike]) primary
+        # keys already serve the "latest snapshot for symbol" lookups as an
+        # index seek (backward scan, no sort), and extra indexes would only
+        # slow down the backfill inserts.
         # Table for Aggregate PCR/OI data
         cursor.execute('''CREATE TABLE IF NOT EXISTS option_aggregates (
                             symbol TEXT, 
@@ -44,7 +211,7 @@ class OptionDatabase:
                             PRIMARY KEY (symbol, date, timestamp)
                           )''')
         
-        # Table for Per-Strike detailed data
+        # Table for Per-Strike detailed data (legacy - read only, see option_chain_blob)
         cursor.execute('''CREATE TABLE IF NOT EXISTS option_chain_details (
                             symbol TEXT, 
                             date TEXT, 
@@ -56,6 +223,19 @@ class OptionDatabase:
                             put_oi_chg INTEGER,
                             PRIMARY KEY (symbol, date, timestamp, strike)
                           )''')
+        # Per-strike data, one row per snapshot: strikes is a packed float64
+        # array, each OI column a _encode_oi blob, one entry per strike
+        cursor.execute('''CREATE TABLE IF NOT EXISTS option_chain_blob (
+                            symbol TEXT, 
+                            date TEXT, 
+                            timestamp TEXT, 
+                            strikes BLOB,
+                            call_oi BLOB,
+                            put_oi BLOB,
+                            call_oi_chg BLOB,
+                            put_oi_chg BLOB,
+                            PRIMARY KEY (symbol, date, timestamp)
+                          )''')
         # Table for Market Breadth
         cursor.execute('''CREATE TABLE IF NOT EXISTS market_breadth (
                             date TEXT, 
@@ -75,155 +255,299 @@ class OptionDatabase:
                             put_oi INTEGER,
                             PRIMARY KEY (symbol, date)
                           )''')
-        conn.commit()
-        conn.close()
+        # Trendlyne lookups persisted across restarts
+        cursor.execute('''CREATE TABLE IF NOT EXISTS symbol_meta (
+                            symbol TEXT PRIMARY KEY,
+                            stock_id INTEGER,
+                            expiry TEXT,
+                            expiry_fetched_at TEXT
+                          )''')
 
-    def save_snapshot(self, symbol, trading_date, timestamp, expiry, aggregates, details):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def begin_bulk(self):
+        """
+        Buffers the following save_snapshot_arrays(..., bulk=True) calls and writes
+        them BULK_FLUSH_SIZE at a time. Each flush is one short transaction, so the
+        write lock is never held across the HTTP fetches in between (other writers
+        keep working). Saves without bulk=True are still written immediately.
+        """
+        with self._lock:
+            self._in_bulk = True
+
+    def commit_bulk(self):
+        """Writes whatever the bulk load still has buffered and leaves bulk mode."""
+        with self._lock:
+            self._in_bulk = False
+            self._flush_bulk()
+
+    def _flush_bulk(self):
+        """Writes the buffered snapshots in one transaction (caller holds self._lock)."""
+        rows, self._bulk_rows = self._bulk_rows, []
+        if not rows:
+            return
         try:
-            # Save Aggregates
-            cursor.execute("""INSERT OR REPLACE INTO option_aggregates 
-                              VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                           (symbol, trading_date, timestamp, expiry, 
-                            aggregates['call_oi'], aggregates['put_oi'], aggregates['pcr']))
-            
-            # Save Details
-            for strike, d in details.items():
-                cursor.execute("""INSERT OR REPLACE INTO option_chain_details 
-                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                               (symbol, trading_date, timestamp, float(strike),
-                                d['call_oi'], d['put_oi'], d['call_oi_chg'], d['put_oi_chg']))
-            
-            conn.commit()
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.executemany(SQL_INSERT_AGGREGATES, [agg_row for agg_row, _ in rows])
+            self.conn.executemany(SQL_INSERT_CHAIN_BLOB, [blob_row for _, blob_row in rows])
+            self.conn.execute("COMMIT")
         except Exception as e:
-            print(f"[DB ERROR] {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            log.error(f"[DB ERROR] Bulk write of {len(rows)} snapshots failed, retrying one by one: {e}")
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            # One bad row must not cost the rest of the batch
+            for agg_row, blob_row in rows:
+                try:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    self.conn.execute(SQL_INSERT_AGGREGATES, agg_row)
+                    self.conn.execute(SQL_INSERT_CHAIN_BLOB, blob_row)
+                    self.conn.execute("COMMIT")
+                except Exception as e:
+                    log.error(f"[DB ERROR] {e}")
+                    if self.conn.in_transaction:
+                        self.conn.execute("ROLLBACK")
+
+    def analyze(self):
+        """Refreshes planner statistics after a bulk load."""
+        with self._lock:
+            self.conn.execute("ANALYZE")
+
+    def close(self):
+        # Safe to call twice - an explicit close() and then the atexit hook
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            atexit.unregister(self.close)
+            # Let SQLite update any statistics the session's queries would benefit from
+            try:
+                self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                log.warning(f"[WARN] PRAGMA optimize failed: {e}")
+            self.conn.close()
 
-    def save_breadth(self, trading_date, timestamp, data):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def save_snapshot(self, symbol, trading_date, timestamp, expiry, aggregates, details):
+        """Saves one chain snapshot. Returns the saved chain (get_latest_chain format), or None on error."""
         try:
-            cursor.execute("""INSERT OR REPLACE INTO market_breadth 
-                              VALUES (?, ?, ?, ?, ?, ?)""",
-                           (trading_date, timestamp, 
-                            data['advances'], data['declines'], data['unchanged'], data['total']))
-            conn.commit()
+            strikes = np.array([float(s) for s in details], dtype=STRIKE_DTYPE)
+            values = list(details.values())
+            columns = [np.array([d[c] for d in values], dtype=OI_DTYPE) for c in CHAIN_COLUMNS]
         except Exception as e:
-            print(f"[DB ERROR Breadth] {e}")
-            conn.rollback()
-        finally:
-            conn.close()
+            log.error(f"[DB ERROR] {e}")
+            return None
+        # Sorted here too, so the chain returned below matches what was stored
+        strikes, columns = _sort_by_strike(strikes, columns)
+        if not self.save_snapshot_arrays(symbol, trading_date, timestamp, expiry, aggregates,
+                                         strikes, *columns):
+            return None
+        # Callers that need the chain get it from memory, not a re-read
+        return _chain_rows(strikes, columns)
+
+    def save_snapshot_arrays(self, symbol, trading_date, timestamp, expiry, aggregates,
+                             strikes, call_oi, put_oi, call_oi_chg, put_oi_chg, bulk=False):
+        """
+        Same as save_snapshot, but takes one numpy array per column instead of
+        per-strike dicts. Returns True if the snapshot was written.
+        With bulk=True inside begin_bulk/commit_bulk the snapshot is only queued:
+        True then means "queued", and readers (get_latest_chain,
+        get_snapshot_timestamps) see it after the next flush - at the latest
+        commit_bulk. Live callers leave bulk=False, so a True is always visible.
+        An empty chain is not written, so it never replaces the latest real one.
+        """
+        if not len(strikes):
+            log.warning(f"[WARN] {symbol} @ {timestamp}: empty option chain, not saved")
+            return False
+        try:
+            agg_row = (symbol, trading_date, timestamp, expiry,
+                       aggregates['call_oi'], aggregates['put_oi'], aggregates['pcr'])
+        except (KeyError, TypeError) as e:
+            log.error(f"[DB ERROR] {e}")
+            return False
+        # Ascending strikes - consumers expect it, and OI deltas compress better
+        strikes, (call_oi, put_oi, call_oi_chg, put_oi_chg) = _sort_by_strike(
+            strikes, (call_oi, put_oi, call_oi_chg, put_oi_chg))
+        blob_row = (symbol, trading_date, timestamp,
+                    strikes.tobytes(),
+                    _encode_oi(call_oi),
+                    _encode_oi(put_oi),
+                    _encode_oi(call_oi_chg),
+                    _encode_oi(put_oi_chg))
+        
+        with self._lock:
+            if bulk and self._in_bulk:
+                self._bulk_rows.append((agg_row, blob_row))
+                if len(self._bulk_rows) >= BULK_FLUSH_SIZE:
+                    self._flush_bulk()
+                return True
+            
+            cursor = self.conn.cursor()
+            try:
+                # Take the write lock up front - no upgrade from a read lock mid-way
+                cursor.execute("BEGIN IMMEDIATE")
+                # Save Aggregates
+                cursor.execute(SQL_INSERT_AGGREGATES, agg_row)
+                
+                # Save Details - the whole chain is a single row
+                cursor.execute(SQL_INSERT_CHAIN_BLOB, blob_row)
+                
+                cursor.execute("COMMIT")
+            except Exception as e:
+                log.error(f"[DB ERROR] {e}")
+                if self.conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                return False
+        return True
+
+    def save_breadth(self, trading_date, timestamp, data):
+        with self._lock:
+            try:
+                self.conn.execute(SQL_INSERT_BREADTH,
+                                  (trading_date, timestamp, 
+                                   data['advances'], data['declines'], data['unchanged'], data['total']))
+            except Exception as e:
+                log.error(f"[DB ERROR Breadth] {e}")
+
+    def _row_cursor(self):
+        """Cursor returning sqlite3.Row, so getters can build dicts by column name."""
+        cursor = self.conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor
 
     def get_latest_breadth(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""SELECT * FROM market_breadth 
-                          ORDER BY date DESC, timestamp DESC LIMIT 1""")
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return {
-                'date': row[0],
-                'timestamp': row[1],
-                'advances': row[2],
-                'declines': row[3],
-                'unchanged': row[4],
-                'total': row[5]
-            }
-        return None
+        with self._lock:
+            cursor = self._row_cursor()
+            cursor.execute(SQL_LATEST_BREADTH)
+            row = cursor.fetchone()
+        return dict(row) if row else None
 
     def get_latest_aggregates(self, symbol):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""SELECT * FROM option_aggregates 
-                          WHERE symbol=? 
-                          ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
-        row = cursor.fetchone()
-        conn.close()
-        if row:
-            return {
-                'symbol': row[0],
-                'date': row[1],
-                'timestamp': row[2],
-                'expiry': row[3],
-                'call_oi': row[4],
-                'put_oi': row[5],
-                'pcr': row[6]
-            }
-        return None
+        with self._lock:
+            cursor = self._row_cursor()
+            cursor.execute(SQL_LATEST_AGGREGATES, (symbol,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
 
     def get_latest_chain(self, symbol):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        # Get latest timestamp
-        cursor.execute("""SELECT date, timestamp FROM option_chain_details 
-                          WHERE symbol=? 
-                          ORDER BY date DESC, timestamp DESC LIMIT 1""", (symbol,))
-        last = cursor.fetchone()
-        if not last:
-            conn.close()
-            return []
+        with self._lock:
+            cursor = self._row_cursor()
+            cursor.execute(SQL_LATEST_CHAIN_BLOB, (symbol,))
+            blob = cursor.fetchone()
+            if blob is None:
+                # Latest timestamp and its strikes in one statement
+                cursor.execute(SQL_LATEST_CHAIN, (symbol,))
+                rows = cursor.fetchall()
         
-        d, ts = last
-        cursor.execute("""SELECT * FROM option_chain_details 
-                          WHERE symbol=? AND date=? AND timestamp=?""", (symbol, d, ts))
-        rows = cursor.fetchall()
-        conn.close()
+        if blob is None:
+            return [dict(r) for r in rows]
         
-        chain = []
-        for r in rows:
-            chain.append({
-                'strike': r[3],
-                'call_oi': r[4],
-                'put_oi': r[5],
-                'call_oi_chg': r[6],
-                'put_oi_chg': r[7]
-            })
-        return chain
+        # Blobs written before strikes were sorted on save may be out of order
+        return _chain_rows(*_sort_by_strike(np.frombuffer(blob['strikes'], dtype=STRIKE_DTYPE),
+                                            [_decode_oi(blob[c]) for c in CHAIN_COLUMNS]))
 
     def save_daily_stats(self, symbol, trading_date, pcr, call_oi, put_oi):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        try:
-            cursor.execute("""INSERT OR REPLACE INTO pcr_history 
-                              VALUES (?, ?, ?, ?, ?)""",
-                           (symbol, trading_date, pcr, call_oi, put_oi))
-            conn.commit()
-        except Exception as e:
-            print(f"[DB ERROR Stats] {e}")
-        finally:
-            conn.close()
+        with self._lock:
+            try:
+                self.conn.execute(SQL_INSERT_PCR_HISTORY,
+                                  (symbol, trading_date, pcr, call_oi, put_oi))
+            except Exception as e:
+                log.error(f"[DB ERROR Stats] {e}")
 
     def get_pcr_history(self, symbol, days=30):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("""SELECT * FROM pcr_history 
-                          WHERE symbol=? 
-                          ORDER BY date DESC LIMIT ?""", (symbol, days))
-        rows = cursor.fetchall()
-        conn.close()
+        with self._lock:
+            cursor = self.conn.execute(SQL_PCR_HISTORY, (symbol, days))
+            rows = cursor.fetchall()
         return rows
 
+    def get_snapshot_timestamps(self, symbol, trading_date):
+        """Set of timestamps already stored for symbol on trading_date"""
+        with self._lock:
+            cursor = self.conn.execute(SQL_SNAPSHOT_TIMESTAMPS, (symbol, trading_date))
+            return {r[0] for r in cursor}
+
+    def get_symbol_meta(self, symbol):
+        with self._lock:
+            cursor = self._row_cursor()
+            cursor.execute(SQL_SYMBOL_META, (symbol,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def save_stock_id(self, symbol, stock_id):
+        with self._lock:
+            try:
+                self.conn.execute(SQL_UPSERT_STOCK_ID, (symbol, stock_id))
+            except Exception as e:
+                log.error(f"[DB ERROR Meta] {e}")
+
+    def save_expiry(self, symbol, expiry):
+        with self._lock:
+            try:
+                self.conn.execute(SQL_UPSERT_EXPIRY, (symbol, expiry, datetime.now().isoformat()))
+            except Exception as e:
+                log.error(f"[DB ERROR Meta] {e}")
+
 # Keep a cache to avoid repeated API calls
 STOCK_ID_CACHE = {}
 EXPIRY_CACHE = {}  # Cache for expiry dates
+EXPIRY_MAX_AGE_HOURS = 24  # Re-check persisted expiries at least daily
 DB = OptionDatabase()
 
+# Shared keep-alive session - reuses TCP/TLS connections across all Trendlyne calls
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+BACKFILL_WORKERS = 8  # Concurrent time-slot fetches per symbol
+BACKFILL_MAX_CONNECTIONS = 16  # httpx connection cap for the async backfill
+OI_DATA_URL = "https://smartoptions.trendlyne.com/phoenix/api/live-oi-data/"
+TRENDLYNE_REQUESTS_PER_SEC = 20  # Sustained OI-data request budget (bursts up to the same)
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to
+    `capacity`. Callers only wait once the budget is actually exhausted.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens):
+        """Takes the tokens (going into debt if short) and returns the seconds to wait for them."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def consume(self, tokens=1):
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def consume_async(self, tokens=1):
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+OI_DATA_BUCKET = TokenBucket(rate=TRENDLYNE_REQUESTS_PER_SEC, capacity=TRENDLYNE_REQUESTS_PER_SEC)
+
 def get_stock_id_for_symbol(symbol):
     """Automatically lookup Trendlyne stock ID for a given symbol"""
     if symbol in STOCK_ID_CACHE:
         return STOCK_ID_CACHE[symbol]
     
+    # Stock IDs never change - reuse one found by an earlier run
+    meta = DB.get_symbol_meta(symbol)
+    if meta and meta['stock_id']:
+        STOCK_ID_CACHE[symbol] = meta['stock_id']
+        return meta['stock_id']
+    
     search_url = "https://smartoptions.trendlyne.com/phoenix/api/search-contract-stock/"
     params = {'query': symbol.lower()}
     
     try:
-        response = requests.get(search_url, params=params, timeout=10)
+        response = SESSION.get(search_url, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         
         if data and 'body' in data and 'data' in data['body'] and len(data['body']['data']) > 0:
             # Match strictly or take first
@@ -231,78 +555,188 @@ def get_stock_id_for_symbol(symbol):
                 if item.get('stock_code', '').upper() == symbol.upper():
                     stock_id = item['stock_id']
                     STOCK_ID_CACHE[symbol] = stock_id
+                    DB.save_stock_id(symbol, stock_id)
                     return stock_id
             
             stock_id = data['body']['data'][0]['stock_id']
             STOCK_ID_CACHE[symbol] = stock_id
+            DB.save_stock_id(symbol, stock_id)
             return stock_id
         return None
     except Exception as e:
-        print(f"[ERROR] Stock Lookup {symbol}: {e}")
+        log.error(f"[ERROR] Stock Lookup {symbol}: {e}")
         return None
 
-def backfill_from_trendlyne(symbol, stock_id, expiry_date_str, timestamp_snapshot):
-    """Fetch and save historical OI data from Trendlyne for a specific timestamp snapshot"""
-    
-    url = f"https://smartoptions.trendlyne.com/phoenix/api/live-oi-data/"
-    params = {
+def _expiry_is_current(expiry):
+    try:
+        return datetime.strptime(expiry, "%Y-%m-%d").date() >= date.today()
+    except (TypeError, ValueError):
+        return False
+
+def get_nearest_expiry(symbol, stock_id, timeout=5):
+    """
+    Nearest option expiry for a symbol: memory cache, then symbol_meta
+    (if fetched within EXPIRY_MAX_AGE_HOURS), then the Trendlyne API.
+    Expired dates are never reused. Network errors propagate to the caller.
+    """
+    expiry = EXPIRY_CACHE.get(symbol)
+    if expiry and _expiry_is_current(expiry):
+        return expiry
+
+    meta = DB.get_symbol_meta(symbol)
+    if meta and meta['expiry_fetched_at'] and _expiry_is_current(meta['expiry']):
+        age = datetime.now() - datetime.fromisoformat(meta['expiry_fetched_at'])
+        if age < timedelta(hours=EXPIRY_MAX_AGE_HOURS):
+            EXPIRY_CACHE[symbol] = meta['expiry']
+            return meta['expiry']
+
+    expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
+    resp = SESSION.get(expiry_url, timeout=timeout)
+    expiry_list = json_loads(resp.content).get('body', {}).get('expiryDates', [])
+    if not expiry_list:
+        return None
+
+    expiry = expiry_list[0]
+    EXPIRY_CACHE[symbol] = expiry
+    DB.save_expiry(symbol, expiry)
+    return expiry
+
+def _oi_data_params(stock_id, expiry_date_str, timestamp_snapshot):
+    return {
         'stockId': stock_id,
         'expDateList': expiry_date_str,
         'minTime': "09:15",
         'maxTime': timestamp_snapshot 
     }
+
+# Per-strike fields of a live-oi-data row, in CHAIN_COLUMNS order
+OI_DATA_FIELDS = ('callOi', 'putOi', 'callOiChange', 'putOiChange')
+_oi_data_getter = itemgetter(*OI_DATA_FIELDS)
+
+def _save_oi_payload(symbol, expiry_date_str, timestamp_snapshot, data, bulk=False):
+    """
+    Parse a live-oi-data response and save it as a snapshot. Returns False on a non-OK status or DB error.
+    bulk=True queues the snapshot for the running bulk load (see OptionDatabase.save_snapshot_arrays).
+    """
+    if data['head']['status'] != '0':
+        return False
+    
+    body = data['body']
+    oi_data = body.get('oiData') or {}
+    if not oi_data:
+        # No strikes (holiday, pre-open) - keep the last real chain as the latest
+        log.warning(f"[WARN] {symbol} @ {timestamp_snapshot}: empty oiData, snapshot skipped")
+        return False
+    input_data = body.get('inputData', {})
+
+    trading_date = input_data.get('tradingDate', date.today().strftime("%Y-%m-%d"))
+    expiry = input_data.get('expDateList', [expiry_date_str])[0]
     
+    # One array per column - totals are summed in C, no per-strike dicts
+    n = len(oi_data)
+    strike_rows = oi_data.values()
+    strikes = np.fromiter((float(s) for s in oi_data), dtype=np.float64, count=n)
     try:
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data['head']['status'] != '0':
-            return False
-        
-        body = data['body']
-        oi_data = body.get('oiData', {})
-        input_data = body.get('inputData', {})
+        # One C-level itemgetter call per strike instead of four dict.get calls
+        oi_table = np.array(list(map(_oi_data_getter, strike_rows)), dtype=np.int64)
+    except KeyError:
+        # Some strike omits a field - default the missing ones to 0
+        oi_table = np.array([[r.get(f, 0) for f in OI_DATA_FIELDS] for r in strike_rows], dtype=np.int64)
+    call_oi, put_oi, call_oi_chg, put_oi_chg = oi_table.reshape(n, len(OI_DATA_FIELDS)).T
 
-        trading_date = input_data.get('tradingDate', date.today().strftime("%Y-%m-%d"))
-        expiry = input_data.get('expDateList', [expiry_date_str])[0]
-        
-        total_call_oi = 0
-        total_put_oi = 0
-        details = {}
+    total_call_oi = int(call_oi.sum())
+    total_put_oi = int(put_oi.sum())
 
-        for strike_str, strike_data in oi_data.items():
-            c_oi = int(strike_data.get('callOi', 0))
-            p_oi = int(strike_data.get('putOi', 0))
-            total_call_oi += c_oi
-            total_put_oi += p_oi
-            
-            details[strike_str] = {
-                'call_oi': c_oi,
-                'put_oi': p_oi,
-                'call_oi_chg': int(strike_data.get('callOiChange', 0)),
-                'put_oi_chg': int(strike_data.get('putOiChange', 0))
-            }
+    pcr = round(total_put_oi / total_call_oi, 2) if total_call_oi > 0 else 1.0
+    
+    aggregates = {
+        'call_oi': total_call_oi,
+        'put_oi': total_put_oi,
+        'pcr': pcr
+    }
 
-        pcr = round(total_put_oi / total_call_oi, 2) if total_call_oi > 0 else 1.0
-        
-        aggregates = {
-            'call_oi': total_call_oi,
-            'put_oi': total_put_oi,
-            'pcr': pcr
-        }
+    return DB.save_snapshot_arrays(symbol, trading_date, timestamp_snapshot, expiry, aggregates,
+                                   strikes, call_oi, put_oi, call_oi_chg, put_oi_chg, bulk=bulk)
 
-        DB.save_snapshot(symbol, trading_date, timestamp_snapshot, expiry, aggregates, details)
-        return True
+def get_session_trading_date(symbol, stock_id, expiry_date_str):
+    """
+    Trading date Trendlyne files snapshots under - the last session, which is not
+    today before the open or on weekends and holidays. Falls back to today, the
+    same default _save_oi_payload uses.
+    """
+    params = _oi_data_params(stock_id, expiry_date_str, "09:15")
+    try:
+        OI_DATA_BUCKET.consume()
+        response = SESSION.get(OI_DATA_URL, params=params, timeout=10)
+        response.raise_for_status()
+        input_data = json_loads(response.content).get('body', {}).get('inputData', {})
+        trading_date = input_data.get('tradingDate')
+        if trading_date:
+            return trading_date
+    except Exception as e:
+        log.warning(f"[WARN] Trading date lookup for {symbol} failed: {e}")
+    return date.today().strftime("%Y-%m-%d")
+
+def backfill_from_trendlyne(symbol, stock_id, expiry_date_str, timestamp_snapshot, bulk=False):
+    """Fetch and save historical OI data from Trendlyne for a specific timestamp snapshot"""
+    
+    params = _oi_data_params(stock_id, expiry_date_str, timestamp_snapshot)
+    
+    try:
+        OI_DATA_BUCKET.consume()
+        response = SESSION.get(OI_DATA_URL, params=params, timeout=10)
+        response.raise_for_status()
+        return _save_oi_payload(symbol, expiry_date_str, timestamp_snapshot, json_loads(response.content),
+                                bulk=bulk)
+
+    except Exception as e:
+        log.error(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
+        return False
 
     except Exception as e:
-        print(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
+        log.error(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
         return False
 
+async def backfill_async(symbol, stock_id, expiry_date_str, timestamp_snapshot, client):
+    """backfill_from_trendlyne over a shared httpx.AsyncClient, queued for the running bulk load"""
+    params = _oi_data_params(stock_id, expiry_date_str, timestamp_snapshot)
+    
+    try:
+        await OI_DATA_BUCKET.consume_async()
+        response = await client.get(OI_DATA_URL, params=params)
+        response.raise_for_status()
+        # Saving runs on the loop thread, so writes are already serialized
+        return _save_oi_payload(symbol, expiry_date_str, timestamp_snapshot, json_loads(response.content),
+                                bulk=True)
+
     except Exception as e:
-        print(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
+        log.error(f"[ERROR] Fetch {symbol} @ {timestamp_snapshot}: {e}")
         return False
 
+async def _backfill_symbol_async(symbol, stock_id, expiry_date_str, time_slots):
+    """Fetch every time slot concurrently over HTTP/2. Returns the number of saved snapshots."""
+    limits = httpx.Limits(max_connections=BACKFILL_MAX_CONNECTIONS)
+    # No pool timeout - every slot is queued up front and waits for a stream
+    timeout = httpx.Timeout(10, pool=None)
+    async with httpx.AsyncClient(http2=True, limits=limits, timeout=timeout) as client:
+        results = await asyncio.gather(*(backfill_async(symbol, stock_id, expiry_date_str, ts, client)
+                                         for ts in time_slots))
+    return sum(results)
+
+# Upstox OptionsApi shared across ticks (one connection pool), rebuilt if the token changes
+_UPSTOX_API = None
+_UPSTOX_TOKEN = None
+
+def _get_upstox_options_api():
+    global _UPSTOX_API, _UPSTOX_TOKEN
+    token = config.ACCESS_TOKEN
+    if _UPSTOX_API is None or _UPSTOX_TOKEN != token:
+        configuration = upstox_client.Configuration()
+        configuration.access_token = token
+        _UPSTOX_API = upstox_client.OptionsApi(upstox_client.ApiClient(configuration))
+        _UPSTOX_TOKEN = token
+    return _UPSTOX_API
+
 def fetch_live_snapshot_upstox(symbol):
     """
     Fetches live option chain from Upstox Primary API and saves to DB.
@@ -345,22 +779,14 @@ def fetch_live_snapshot_upstox(symbol):
              if stock_id:
                  # Quick fetch of expiry via Trendlyne API (lightweight)
                  try:
-                     expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
-                     resp = requests.get(expiry_url, timeout=5)
-                     ex_list = resp.json().get('body', {}).get('expiryDates', [])
-                     if ex_list:
-                         expiry = ex_list[0]
-                         EXPIRY_CACHE[symbol] = expiry
+                     expiry = get_nearest_expiry(symbol, stock_id)
                  except: pass
         
         if not expiry:
             return None
 
         # 3. Call Upstox API
-        configuration = upstox_client.Configuration()
-        configuration.access_token = config.ACCESS_TOKEN
-        api_client = upstox_client.ApiClient(configuration)
-        api_instance = upstox_client.OptionsApi(api_client)
+        api_instance = _get_upstox_options_api()
 
         response = api_instance.get_put_call_option_chain(instrument_key, expiry)
         
@@ -416,11 +842,10 @@ def fetch_live_snapshot_upstox(symbol):
             'pcr': pcr
         }
         
-        DB.save_snapshot(symbol, trading_date, ts, expiry, aggregates, details)
-        return DB.get_latest_chain(symbol)
+        return DB.save_snapshot(symbol, trading_date, ts, expiry, aggregates, details)
 
     except Exception as e:
-        print(f"[UPSTOX OCR FAIL] {symbol}: {e}")
+        log.error(f"[UPSTOX OCR FAIL] {symbol}: {e}")
         return None
 
 def fetch_live_snapshot(symbol):
@@ -440,28 +865,12 @@ def fetch_live_snapshot(symbol):
     if not stock_id:
         return []
 
-    # Get Expiry (cached)
-    expiry = EXPIRY_CACHE.get(symbol)
-    # Simple validation: if expiry is in the past, refresh
-    if expiry:
-        try:
-             exp_date = datetime.strptime(expiry, "%Y-%m-%d").date()
-             if date.today() > exp_date:
-                 expiry = None
-        except:
-             expiry = None
-
-    if not expiry: 
-        try:
-             expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
-             resp = requests.get(expiry_url, timeout=5)
-             expiry_list = resp.json().get('body', {}).get('expiryDates', [])
-             if expiry_list:
-                 expiry = expiry_list[0]
-                 EXPIRY_CACHE[symbol] = expiry
-        except Exception as e:
-             print(f"[WARN] Failed to fetch expiry for {symbol}: {e}")
-             pass
+    # Get Expiry (cached; past expiries are refreshed)
+    expiry = None
+    try:
+         expiry = get_nearest_expiry(symbol, stock_id)
+    except Exception as e:
+         log.warning(f"[WARN] Failed to fetch expiry for {symbol}: {e}")
     
     if not expiry:
         return DB.get_latest_chain(symbol)
@@ -476,24 +885,21 @@ def fetch_live_snapshot(symbol):
     # Return latest from DB (whether update succeeded or not, we return best available)
     return DB.get_latest_chain(symbol)
 
+@functools.lru_cache(maxsize=32)
 def generate_time_intervals(start_time="09:15", end_time="15:30", interval_minutes=1):
-    """Generate time strings in HH:MM format with 1-minute default"""
-    start = datetime.strptime(start_time, "%H:%M")
-    end = datetime.strptime(end_time, "%H:%M")
-    current = start
-    times = []
-    while current <= end:
-        times.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=interval_minutes)
-    return times
+    """Generate time strings in HH:MM format with 1-minute default (cached, returns a tuple)"""
+    sh, sm = map(int, start_time.split(':'))
+    eh, em = map(int, end_time.split(':'))
+    return tuple(f"{m // 60:02d}:{m % 60:02d}"
+                 for m in range(sh * 60 + sm, eh * 60 + em + 1, interval_minutes))
 
 def run_backfill(symbols_list=None):
     if not symbols_list:
         symbols_list = ["NIFTY", "BANKNIFTY", "RELIANCE", "SBIN", "HDFCBANK"]
 
-    print("=" * 60)
-    print(f"STARTING TRENDLYNE BACKFILL (1-MIN INTERVALS)")
-    print("=" * 60)
+    log.info("=" * 60)
+    log.info(f"STARTING TRENDLYNE BACKFILL (1-MIN INTERVALS)")
+    log.info("=" * 60)
 
     now = datetime.now()
     market_open = now.replace(hour=9, minute=15, second=0, microsecond=0)
@@ -507,38 +913,55 @@ def run_backfill(symbols_list=None):
         end_time_str = now.strftime("%H:%M")
 
     time_slots = generate_time_intervals(end_time=end_time_str)
-    print(f"Time Slots: {len(time_slots)} | Symbols: {len(symbols_list)}")
+    log.info(f"Time Slots: {len(time_slots)} | Symbols: {len(symbols_list)}")
 
     for symbol in symbols_list:
         stock_id = get_stock_id_for_symbol(symbol)
         if not stock_id:
-            print(f"[SKIP] No Stock ID for {symbol}")
+            log.warning(f"[SKIP] No Stock ID for {symbol}")
             continue
 
         try:
             # Fetch Expiry
-            expiry_url = f"https://smartoptions.trendlyne.com/phoenix/api/fno/get-expiry-dates/?mtype=options&stock_id={stock_id}"
-            resp = requests.get(expiry_url, timeout=10)
-            expiry_list = resp.json().get('body', {}).get('expiryDates', [])
-            if not expiry_list:
-                print(f"[SKIP] No Expiry for {symbol}")
+            nearest_expiry = get_nearest_expiry(symbol, stock_id, timeout=10)
+            if not nearest_expiry:
+                log.warning(f"[SKIP] No Expiry for {symbol}")
                 continue
             
-            nearest_expiry = expiry_list[0]
-            print(f"Syncing {symbol} | Expiry: {nearest_expiry}...")
-
-            success_count = 0
-            for ts in time_slots:
-                if backfill_from_trendlyne(symbol, stock_id, nearest_expiry, ts):
-                    success_count += 1
-                
-                # Sleep briefly to avoid rate limits
-                if success_count % 10 == 0:
-                    time.sleep(0.1)
-
-            print(f"[OK] {symbol}: Captured {success_count}/{len(time_slots)} points")
+            log.info(f"Syncing {symbol} | Expiry: {nearest_expiry}...")
+
+            # Skip slots a previous run already stored, looked up under the date the
+            # rows are saved with (not the wall clock). The newest stored slot is
+            # fetched again - it may have been captured before its minute closed.
+            trading_date = get_session_trading_date(symbol, stock_id, nearest_expiry)
+            existing = DB.get_snapshot_timestamps(symbol, trading_date)
+            if existing:
+                existing.discard(max(existing))
+            pending = [ts for ts in time_slots if ts not in existing]
+
+            # Snapshots are buffered and written in batches (short transactions,
+            # never held across a fetch); the fetches overlap (HTTP/2
+            # multiplexing, or a thread pool) and writes are serialized
+            DB.begin_bulk()
+            try:
+                if HTTPX_AVAILABLE:
+                    success_count = asyncio.run(
+                        _backfill_symbol_async(symbol, stock_id, nearest_expiry, pending))
+                else:
+                    with ThreadPoolExecutor(max_workers=BACKFILL_WORKERS) as ex:
+                        results = ex.map(lambda ts: backfill_from_trendlyne(symbol, stock_id, nearest_expiry, ts, bulk=True),
+                                         pending)
+                        success_count = sum(results)
+            finally:
+                DB.commit_bulk()
+
+            log.info(f"[OK] {symbol}: Captured {success_count}/{len(pending)} points "
+                     f"({len(time_slots) - len(pending)} already stored)")
         except Exception as e:
-            print(f"[FAIL] {symbol}: {e}")
+            log.error(f"[FAIL] {symbol}: {e}")
+
+    # Tables may have grown from empty - give the planner fresh statistics
+    DB.analyze()
 
 if __name__ == "__main__":
     # You can pass specific symbols or let it use defaults
@@ -15,16 +15,39 @@ Usage:
 
 import argparse
 import asyncio
+import inspect
 import websockets
 import json
 import sqlite3
 from datetime import datetime, timedelta
 import time
+import numpy as np
+import pandas as pd
+
+# orjson encodes straight to UTF-8 bytes several times faster than json.dumps;
+# fall back to compact stdlib output without it. The Java dashboard only handles
+# JSON text frames - the relay sends these bytes as text frames
+try:
+    import orjson
+    def json_dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
 
 # Local modules
 from backfill_trendlyne import DB as TrendlyneDB
+from event_loop import run_event_loop
 
 PORT = 8765
+OPTION_SYMBOLS = ['NIFTY', 'BANKNIFTY']  # Symbols with option chain / PCR data
+# One candle row - packed fields instead of a dict per candle. symbol is an index
+# into BacktestReplayEngine.symbol_names (no fixed-width string to truncate long names).
+# The *_5m fields hold the forming 5-minute bar as of that minute (its close is the 1m close)
+CANDLE_DTYPE = np.dtype([('symbol', 'i4'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'),
+                         ('close', 'f8'), ('volume', 'i8'),
+                         ('open_5m', 'f8'), ('high_5m', 'f8'), ('low_5m', 'f8'), ('volume_5m', 'i8')])
+CLIENT_QUEUE_SIZE = 32  # Frames buffered per client; beyond that the oldest is dropped
 
 class BacktestReplayEngine:
     def __init__(self, target_date, speed=1, start_time="09:15", end_time="15:30"):
@@ -34,58 +57,112 @@ class BacktestReplayEngine:
         self.end_time = end_time
         
         self.db_path = "backtest_data.db"
-        self.clients = set()
+        # Read-only use - autocommit, reused for every load
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self.conn.execute("PRAGMA mmap_size=268435456")
+        self.clients = {}  # websocket -> (outbound queue, latest state frames, relay task)
         self.current_time = None
         self.is_playing = False
+        # Last option_chain / pcr_update frame per (type, symbol) - resent only on change
+        self._last_state = {}
+        
+        # Option data does not change during a replay - read it from the Trendlyne DB once
+        self._pcr_cache = {s: self._load_pcr(s) for s in OPTION_SYMBOLS}
+        self._chain_cache = {s: self._load_option_chain(s) for s in OPTION_SYMBOLS}
         
         # Load all candle data into memory for fast access
+        self.symbol_names = []  # CANDLE_DTYPE symbol index -> symbol name
         self.candle_data = self._load_candle_data()
+        # Candle messages never change during a replay - encode them all up front
+        self.candle_frames = self._build_candle_frames()
         
         print(f"[Replay] Loaded {len(self.candle_data)} minute intervals")
         
     def _load_candle_data(self):
-        """Load all candle data from SQLite into memory grouped by timestamp"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Load all candle data from SQLite into memory grouped by timestamp (CANDLE_DTYPE arrays)"""
+        # Columnar load - no per-row Python tuples
+        df = pd.read_sql_query("""SELECT timestamp, symbol, open, high, low, close, volume
+                                  FROM backtest_candles 
+                                  WHERE date=? 
+                                  ORDER BY timestamp ASC""", self.conn, params=(self.target_date,))
+        if df.empty:
+            return {}
         
-        cursor.execute("""SELECT * FROM backtest_candles 
-                          WHERE date=? 
-                          ORDER BY timestamp ASC""", (self.target_date,))
+        # Running 5-minute bar per symbol, in clock-aligned buckets (09:15, 09:20, ...).
+        # Like a live feed's forming bar, it only includes minutes up to the current one.
+        minutes = df['timestamp'].str[:2].astype(int) * 60 + df['timestamp'].str[3:5].astype(int)
+        bars = df.groupby([df['symbol'], minutes // 5], sort=False)
+        df['open_5m'] = bars['open'].transform('first')
+        df['high_5m'] = bars['high'].cummax()
+        df['low_5m'] = bars['low'].cummin()
+        df['volume_5m'] = bars['volume'].cumsum()
+        codes, names = pd.factorize(df['symbol'])
+        df['symbol'] = codes
+        self.symbol_names = names.tolist()
         
-        rows = cursor.fetchall()
-        conn.close()
+        candles = np.empty(len(df), dtype=CANDLE_DTYPE)
+        for field in CANDLE_DTYPE.names:
+            candles[field] = df[field].to_numpy()
         
-        # Group by timestamp
-        data_by_time = {}
-        for row in rows:
-            symbol, date, ts, open_, high, low, close, volume, source = row
+        # Rows are sorted by timestamp, so each minute is a contiguous slice (a view, no copy)
+        timestamps, starts = np.unique(df['timestamp'].to_numpy(), return_index=True)
+        ends = np.append(starts[1:], len(candles))
+        return {ts: candles[start:end]
+                for ts, start, end in zip(timestamps.tolist(), starts.tolist(), ends.tolist())}
+    
+    def _build_candle_frames(self):
+        """Encode the candle_update message for every minute (timestamp -> UTF-8 JSON)"""
+        frames = {}
+        for timestamp_str, candles_at_time in self.candle_data.items():
+            # Calculate timestamp in epoch milliseconds (same for every candle of the minute)
+            dt = datetime.strptime(f"{self.target_date} {timestamp_str}", "%Y-%m-%d %H:%M")
+            ts_ms = int(dt.timestamp() * 1000)
             
-            if ts not in data_by_time:
-                data_by_time[ts] = []
+            # Convert to bridge format (tolist() yields native floats/ints for JSON)
+            candle_updates = []
+            columns = (candles_at_time[field].tolist() for field in CANDLE_DTYPE.names)
+            for symbol_idx, open_, high, low, close, volume, open_5m, high_5m, low_5m, volume_5m in zip(*columns):
+                symbol = self.symbol_names[symbol_idx]
+                candle_updates.append({
+                    "symbol": symbol,
+                    "timestamp": ts_ms,
+                    "1m": {
+                        "open": open_,
+                        "high": high,
+                        "low": low,
+                        "close": close,
+                        "volume": volume,
+                        "vwap": close  # Approximation
+                    },
+                    "5m": {
+                        "open": open_5m,
+                        "high": high_5m,
+                        "low": low_5m,
+                        "close": close,
+                        "volume": volume_5m
+                    },
+                    "pcr": self._get_pcr(symbol)
+                })
             
-            data_by_time[ts].append({
-                'symbol': symbol,
-                'timestamp_str': ts,
-                'open': open_,
-                'high': high,
-                'low': low,
-                'close': close,
-                'volume': volume,
-                'source': source
-            })
+            message = {
+                "type": "candle_update",
+                "data": candle_updates
+            }
+            # UTF-8 bytes, ready to queue - still sent to clients as text frames
+            frames[timestamp_str] = json_dumps(message)
         
-        return data_by_time
+        return frames
     
-    def _get_option_chain(self, symbol, current_time_str):
-        """Fetch option chain data for given symbol and time from Trendlyne DB"""
+    def _load_option_chain(self, symbol):
+        """Fetch option chain data for given symbol from Trendlyne DB"""
         try:
-            # Get closest option chain snapshot before or at current_time
+            # Latest snapshot in the DB (the replay does not track chain history)
             chain = TrendlyneDB.get_latest_chain(symbol)  # Gets latest available
             return chain if chain else []
         except:
             return []
     
-    def _get_pcr(self, symbol):
+    def _load_pcr(self, symbol):
         """Get PCR from Trendlyne DB"""
         try:
             agg = TrendlyneDB.get_latest_aggregates(symbol)
@@ -93,65 +170,74 @@ class BacktestReplayEngine:
         except:
             return 1.0
     
+    def _get_option_chain(self, symbol, current_time_str):
+        """Option chain for given symbol and time (cached at startup)"""
+        return self._chain_cache.get(symbol, [])
+    
+    def _get_pcr(self, symbol):
+        """PCR for given symbol (cached at startup, 1.0 for non-index symbols)"""
+        return self._pcr_cache.get(symbol, 1.0)
+    
     async def register_client(self, websocket):
         """Register new WebSocket client"""
-        self.clients.add(websocket)
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        # State topics are only broadcast on change - bring the new client up to date
+        state = dict(self._last_state)
+        if state:
+            queue.put_nowait(None)  # Wake the relay to flush the state slots
+        # Newer websockets send UTF-8 bytes as a text frame as-is (send(..., text=True))
+        bytes_as_text = 'text' in inspect.signature(websocket.send).parameters
+        relay = asyncio.create_task(self._relay(websocket, queue, state, bytes_as_text))
+        self.clients[websocket] = (queue, state, relay)
         print(f"[Client] Connected ({len(self.clients)} total)")
         
     async def unregister_client(self, websocket):
         """Unregister WebSocket client"""
-        self.clients.discard(websocket)
+        entry = self.clients.pop(websocket, None)
+        if entry:
+            entry[2].cancel()
         print(f"[Client] Disconnected ({len(self.clients)} remaining)")
     
+    async def _relay(self, websocket, queue, state, bytes_as_text):
+        """Send queued frames to one client - a slow client only delays itself"""
+        try:
+            while True:
+                data = await queue.get()
+                # Pending state frames (latest per key) go first; a None entry only wakes us
+                frames = [state.pop(key) for key in list(state)]
+                if data is not None:
+                    frames.append(data)
+                for frame in frames:
+                    if bytes_as_text:
+                        await websocket.send(frame, text=True)
+                    else:
+                        await websocket.send(frame.decode())
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            print(f"[Client] Send failed, dropping client: {e}")
+            await websocket.close()
+        # Unreachable client - stop queueing frames for it (handle_client's
+        # unregister_client still runs when the connection finishes closing)
+        self.clients.pop(websocket, None)
+    
+    def _broadcast(self, data):
+        """Queue one encoded JSON message (UTF-8 bytes from json_dumps) for all clients"""
+        for queue, _, _ in self.clients.values():
+            if queue.full():
+                # Drop the oldest frame - a lagging client skips ahead instead of stalling
+                queue.get_nowait()
+            queue.put_nowait(data)
+    
     async def broadcast_candles(self, timestamp_str):
         """Broadcast candle update for given timestamp"""
-        if timestamp_str not in self.candle_data:
-            return
-        
-        candles_at_time = self.candle_data[timestamp_str]
-        
-        # Convert to bridge format
-        candle_updates = []
-        for c in candles_at_time:
-            # Calculate timestamp in epoch milliseconds
-            dt = datetime.strptime(f"{self.target_date} {timestamp_str}", "%Y-%m-%d %H:%M")
-            ts_ms = int(dt.timestamp() * 1000)
-            
-            candle_updates.append({
-                "symbol": c['symbol'],
-                "timestamp": ts_ms,
-                "1m": {
-                    "open": c['open'],
-                    "high": c['high'],
-                    "low": c['low'],
-                    "close": c['close'],
-                    "volume": c['volume'],
-                    "vwap": c['close']  # Approximation
-                },
-                "5m": {  # Placeholder - would need aggregation logic
-                    "open": c['open'],
-                    "high": c['high'],
-                    "low": c['low'],
-                    "close": c['close'],
-                    "volume": c['volume']
-                },
-                "pcr": self._get_pcr(c['symbol']) if c['symbol'] in ['NIFTY', 'BANKNIFTY'] else 1.0
-            })
-        
-        message = {
-            "type": "candle_update",
-            "data": candle_updates
-        }
-        
-        if self.clients:
-            await asyncio.gather(
-                *[client.send(json.dumps(message)) for client in self.clients],
-                return_exceptions=True
-            )
+        payload = self.candle_frames.get(timestamp_str)
+        if payload and self.clients:
+            self._broadcast(payload)
 
     async def broadcast_option_chain(self):
         """Broadcast option chain (once per minute)"""
-        for symbol in ['NIFTY', 'BANKNIFTY']:
+        for symbol in OPTION_SYMBOLS:
             chain = self._get_option_chain(symbol, self.current_time)
             if chain:
                 message = {
@@ -159,28 +245,31 @@ class BacktestReplayEngine:
                     "symbol": symbol,
                     "data": chain
                 }
-                
-                if self.clients:
-                    await asyncio.gather(
-                        *[client.send(json.dumps(message)) for client in self.clients],
-                        return_exceptions=True
-                    )
+                await self._broadcast_if_changed(("option_chain", symbol), message)
     
     async def broadcast_pcr(self):
         """Broadcast PCR update"""
-        for symbol in ['NIFTY', 'BANKNIFTY']:
+        for symbol in OPTION_SYMBOLS:
             pcr = self._get_pcr(symbol)
             message = {
                 "type": "pcr_update",
                 "symbol": symbol,
                 "pcr": pcr
             }
-            
-            if self.clients:
-                await asyncio.gather(
-                    *[client.send(json.dumps(message)) for client in self.clients],
-                    return_exceptions=True
-                )
+            await self._broadcast_if_changed(("pcr_update", symbol), message)
+    
+    async def _broadcast_if_changed(self, key, message):
+        """Broadcast a state message only if it differs from the last one sent for key"""
+        data = json_dumps(message)
+        if self._last_state.get(key) == data:
+            return
+        self._last_state[key] = data
+        # Not queued: drop-oldest could discard the only copy a lagging client
+        # gets. Each client keeps the latest frame per key until its relay sends it
+        for queue, state, _ in self.clients.values():
+            state[key] = data
+            if queue.empty():
+                queue.put_nowait(None)  # Wake an idle relay; a busy one flushes on its next frame
     
     async def replay_loop(self):
         """Main replay loop"""
@@ -192,6 +281,13 @@ class BacktestReplayEngine:
         
         current_dt = start_dt
         
+        # Each tick is scheduled against a fixed start on the monotonic loop
+        # clock, so time spent broadcasting does not accumulate as drift
+        loop = asyncio.get_running_loop()
+        tick_interval = 60.0 / self.speed
+        started_at = loop.time()
+        tick = 0
+        
         while current_dt <= end_dt:
             self.current_time = current_dt.strftime("%H:%M")
             
@@ -206,10 +302,16 @@ class BacktestReplayEngine:
             
             # Advance time
             current_dt += timedelta(minutes=1)
+            tick += 1
             
-            # Sleep based on speed (1 minute / speed)
+            # Sleep until the next tick is due (1 minute / speed per tick)
             if self.speed < 999:
-                await asyncio.sleep(60 / self.speed)
+                delay = started_at + tick * tick_interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                # No pacing, but let the client relays drain their queues
+                await asyncio.sleep(0)
         
         print(f"\n[Replay] Completed - Press Ctrl+C to exit")
     
@@ -244,7 +346,7 @@ class BacktestReplayEngine:
     
     def run(self):
         """Execute replay server"""
-        asyncio.run(self.start_server())
+        run_event_loop(self.start_server())
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Backtest Replay Engine")
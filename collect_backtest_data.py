@@ -14,10 +14,12 @@ import argparse
 import sqlite3
 from datetime import datetime, timedelta
 import time
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 # Upstox SDK
 import upstox_client
+from upstox_client.rest import ApiException
 import config
 
 # TradingView
@@ -37,6 +39,15 @@ SYMBOLS = [
     'HCLTECH', 'NTPC', 'POWERGRID', 'NIFTY', 'BANKNIFTY'
 ]
 
+# Rows per executemany call when bulk-loading candles
+INSERT_BATCH_SIZE = 10000
+SQL_INSERT_CANDLE = "INSERT OR REPLACE INTO backtest_candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+FETCH_WORKERS = 8  # Concurrent Upstox candle downloads
+FETCH_RETRIES = 3  # Attempts per symbol when rate limited (HTTP 429)
+RATE_LIMIT_BACKOFF = 1.0  # Seconds, multiplied by the attempt number
+UPSTOX_POOL_SIZE = 16  # Keep-alive connections kept by the Upstox client (>= FETCH_WORKERS)
+
 class BacktestDataCollector:
     def __init__(self, target_date):
         self.target_date = target_date  # Format: YYYY-MM-DD  
@@ -46,6 +57,9 @@ class BacktestDataCollector:
         # Upstox setup
         self.configuration = upstox_client.Configuration()
         self.configuration.access_token = config.ACCESS_TOKEN
+        # One keep-alive connection per download worker, all in the ApiClient's
+        # single urllib3 pool - extra connections would be opened and discarded
+        self.configuration.connection_pool_maxsize = UPSTOX_POOL_SIZE
         self.api_client = upstox_client.ApiClient(self.configuration)
         self.history_api = upstox_client.HistoryV3Api(self.api_client)
         
@@ -60,10 +74,20 @@ class BacktestDataCollector:
             except Exception as e:
                 print(f"  [WARN] SymbolMaster init attempt {i+1} failed: {e}")
                 time.sleep(2)
-        
+
+    def _connect(self):
+        """Open a connection tuned for bulk writes (autocommit - transactions are explicit)"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None, cached_statements=256)
+        conn.executescript("""PRAGMA journal_mode=WAL;
+                              PRAGMA synchronous=NORMAL;
+                              PRAGMA temp_store=MEMORY;
+                              PRAGMA cache_size=-65536;
+                              PRAGMA mmap_size=268435456;""")
+        return conn
+
     def _init_db(self):
         """Create backtest database schema"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
         
         # Candles table
@@ -79,6 +103,10 @@ class BacktestDataCollector:
                             source TEXT,
                             PRIMARY KEY (symbol, date, timestamp)
                           )''')
+        # The replay loads one date in timestamp order - the primary key
+        # leads with symbol, so it cannot serve that scan
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_date_ts
+                          ON backtest_candles(date, timestamp, symbol)''')
         
         # Metadata table
         cursor.execute('''CREATE TABLE IF NOT EXISTS backtest_metadata (
@@ -94,76 +122,119 @@ class BacktestDataCollector:
         conn.close()
         print(f"[DB] Initialized {self.db_path}")
     
+    def _fetch_candles(self, symbol, u_key):
+        """Fetch one symbol's 1-min candles (runs on a worker thread), retrying on HTTP 429"""
+        # Using get_intra_day_candle_data for today as it's more reliable for 1m
+        # If target_date is not today, we could use get_historical_candle_data1
+        today_str = datetime.now().strftime("%Y-%m-%d")
+        
+        for attempt in range(FETCH_RETRIES):
+            try:
+                if self.target_date == today_str:
+                    # Verified Signature: (instrument_key, unit="minutes", interval="1")
+                    return self.history_api.get_intra_day_candle_data(u_key, "minutes", "1")
+                # For past days
+                return self.history_api.get_historical_candle_data1(
+                    instrument_key=u_key,
+                    unit="minutes",
+                    interval="1",
+                    to_date=self.target_date,
+                    from_date=self.target_date
+                )
+            except ApiException as e:
+                # Only back off when Upstox actually rate-limits us
+                if e.status != 429 or attempt == FETCH_RETRIES - 1:
+                    raise
+                delay = RATE_LIMIT_BACKOFF * (attempt + 1)
+                print(f"  [WARN] {symbol}: rate limited, retrying in {delay}s")
+                time.sleep(delay)
+    
     def collect_upstox_candles(self):
         """Fetch 1-min candles from Upstox for all symbols"""
         print(f"\n[1/3] Collecting Upstox Candles for {self.target_date}...")
         
         candles_collected = 0
         
+        # Resolve keys up front - a failed lookup only skips that symbol
+        keys = {}
         for symbol in SYMBOLS:
             try:
                 u_key = SymbolMaster.get_upstox_key(symbol)
-                if not u_key:
-                    print(f"  [WARN] No Upstox key for {symbol}, skipping...")
-                    continue
-                
-                # Fetch data
-                # Using get_intra_day_candle_data for today as it's more reliable for 1m
-                # If target_date is not today, we could use get_historical_candle_data1
-                today_str = datetime.now().strftime("%Y-%m-%d")
-                
-                if self.target_date == today_str:
-                    # Verified Signature: (instrument_key, unit="minutes", interval="1")
-                    response = self.history_api.get_intra_day_candle_data(u_key, "minutes", "1")
-                else:
-                    # For past days
-                    response = self.history_api.get_historical_candle_data1(
-                        instrument_key=u_key,
-                        unit="minutes",
-                        interval="1",
-                        to_date=self.target_date,
-                        from_date=self.target_date
-                    )
-                
-                if not response or not hasattr(response, 'data') or not hasattr(response.data, 'candles'):
-                    print(f"  [WARN] No data for {symbol}")
-                    continue
-                
-                candles = response.data.candles
-                if not candles:
-                    print(f"  [WARN] Empty candles for {symbol}")
-                    continue
-                
-                # Store in DB
-                conn = sqlite3.connect(self.db_path)
-                cursor = conn.cursor()
-                
-                for candle in candles:
-                    # Format: [timestamp_iso, open, high, low, close, volume, oi]
-                    ts_iso = candle[0]  # e.g., "2026-01-05T09:15:00+05:30"
-                    # Extract HH:MM
-                    ts_time = datetime.fromisoformat(ts_iso).strftime("%H:%M")
-                    
-                    cursor.execute("""INSERT OR REPLACE INTO backtest_candles 
-                                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                                   (symbol, self.target_date, ts_time,
-                                    float(candle[1]),  # open
-                                    float(candle[2]),  # high
-                                    float(candle[3]),  # low
-                                    float(candle[4]),  # close
-                                    int(candle[5]) if symbol not in ['NIFTY', 'BANKNIFTY'] else 0,  # volume (0 for indices)
-                                    'upstox'))
-                
-                conn.commit()
-                conn.close()
-                
-                candles_collected += len(candles)
-                print(f"  ✓ {symbol}: {len(candles)} candles")
-                time.sleep(0.5)  # Rate limiting
-                
             except Exception as e:
                 print(f"  ✗ {symbol}: {e}")
                 continue
+            if not u_key:
+                print(f"  [WARN] No Upstox key for {symbol}, skipping...")
+                continue
+            keys[symbol] = u_key
+        
+        # Download concurrently; responses are parsed here on the calling thread
+        symbol_rows = {}
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            futures = {symbol: executor.submit(self._fetch_candles, symbol, u_key)
+                       for symbol, u_key in keys.items()}
+            
+            for symbol, future in futures.items():
+                try:
+                    response = future.result()
+                    
+                    if not response or not hasattr(response, 'data') or not hasattr(response.data, 'candles'):
+                        print(f"  [WARN] No data for {symbol}")
+                        continue
+                    
+                    candles = response.data.candles
+                    if not candles:
+                        print(f"  [WARN] Empty candles for {symbol}")
+                        continue
+                    
+                    rows = []
+                    for candle in candles:
+                        # Format: [timestamp_iso, open, high, low, close, volume, oi]
+                        ts_iso = candle[0]  # e.g., "2026-01-05T09:15:00+05:30"
+                        # Extract HH:MM - fixed-width ISO string, no datetime parse needed
+                        ts_time = ts_iso[11:16]
+
+                        rows.append((symbol, self.target_date, ts_time,
+                                     float(candle[1]),  # open
+                                     float(candle[2]),  # high
+                                     float(candle[3]),  # low
+                                     float(candle[4]),  # close
+                                     int(candle[5]) if symbol not in ['NIFTY', 'BANKNIFTY'] else 0,  # volume (0 for indices)
+                                     'upstox'))
+                    symbol_rows[symbol] = rows
+                    
+                except Exception as e:
+                    print(f"  ✗ {symbol}: {e}")
+                    continue
+        
+        # One connection and one transaction for the whole run (a single fsync),
+        # opened only after the downloads so the write lock is never held across
+        # HTTP calls. Each symbol is a savepoint, so a failed symbol is undone on its own
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for symbol, rows in symbol_rows.items():
+                # Store in DB - batched executemany inside the symbol's savepoint
+                conn.execute("SAVEPOINT symbol")
+                try:
+                    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                        conn.executemany(SQL_INSERT_CANDLE, rows[i:i + INSERT_BATCH_SIZE])
+                except Exception as e:
+                    conn.execute("ROLLBACK TO symbol")
+                    print(f"  ✗ {symbol}: {e}")
+                    continue
+                finally:
+                    conn.execute("RELEASE symbol")
+                
+                candles_collected += len(rows)
+                print(f"  ✓ {symbol}: {len(rows)} candles")
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
         
         print(f"\n[Upstox] Total candles collected: {candles_collected}")
         return candles_collected
@@ -206,11 +277,11 @@ class BacktestDataCollector:
             
             print(f"  ✓ Trendlyne data stored in options_data.db")
             
-            # Count collected snapshots
+            # Count collected snapshots (one option_chain_blob row per snapshot)
             import sqlite3
             conn = sqlite3.connect("options_data.db")
             cursor = conn.cursor()
-            cursor.execute("""SELECT COUNT(*) FROM option_chain_details 
+            cursor.execute("""SELECT COUNT(*) FROM option_chain_blob 
                               WHERE date=?""", (self.target_date,))
             count = cursor.fetchone()[0]
             conn.close()
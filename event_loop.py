@@ -0,0 +1,20 @@
+"""
+Event loop runner shared by the WebSocket servers (tv_data_bridge, backtest_replay).
+"""
+import asyncio
+
+# uvloop is a faster drop-in event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+def run_event_loop(main):
+    """asyncio.run(main), on uvloop when it is installed."""
+    if uvloop is None:
+        return asyncio.run(main)
+    if hasattr(uvloop, 'run'):
+        return uvloop.run(main)
+    # uvloop < 0.18 has no run() - install its loop policy instead
+    uvloop.install()
+    return asyncio.run(main)
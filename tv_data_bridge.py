@@ -31,12 +31,32 @@ Version: 2.0 (Multi-Source Redundancy)
 import time
 import json
 import asyncio
+import inspect
 import websockets
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from operator import itemgetter
 from tradingview_screener import Query, col
 from NSEAPICLient import NSEHistoricalAPI
 from SymbolMaster import MASTER as SymbolMaster
+from event_loop import run_event_loop
+
+# orjson encodes straight to UTF-8 bytes several times faster than json.dumps
+# (numpy scalars included); the senders relay the bytes as text frames
+try:
+    import orjson
+    def json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+try:
+    from websockets.protocol import State
+    WS_OPEN = State.OPEN
+except ImportError:  # websockets < 11 - same enum value
+    WS_OPEN = 1
 
 # Yahoo Finance Import (Level 3 Fallback)
 try:
@@ -79,14 +99,134 @@ SYMBOLS = [
     'BAJFINANCE', 'ASIANPAINT', 'HCLTECH', 'NTPC', 'POWERGRID'
 ]
 PORT = 8765
+# TradingView screener columns read into each candle packet (VWAP|1 is handled separately)
+CANDLE_COLUMNS = ['name',
+                  'open|1', 'high|1', 'low|1', 'close|1', 'volume|1',
+                  'open|5', 'high|5', 'low|5', 'close|5', 'volume|5']
+# Threads per blocking subsystem - each has its own pool so one slow source can't starve the others
+IO_WORKERS = 8            # Candle sources (Upstox, TradingView, Yahoo)
+NSE_WORKERS = 4           # NSE breadth and option chain (PCR) calls
+OPTION_CHAIN_WORKERS = 2  # Trendlyne/Upstox option chain snapshots (fetch + save)
+CLIENT_QUEUE_SIZE = 64  # Messages buffered per client; beyond that the oldest is dropped
+PCR_IDLE_INTERVAL = 300  # Seconds between PCR refreshes while no client is connected
+SEND_TIMEOUT = 2.0  # Seconds one send may wait on a client's full TCP buffer before it is dropped
 
 class TVCandleBridge:
     def __init__(self, symbols):
         self.symbols = symbols
         self.nse = NSEHistoricalAPI()
         self.tickers = [f"NSE:{s}" for s in symbols]
-        self.clients = set()
+        # Yahoo Format: RELIANCE.NS, ^NSEI (Nifty), ^NSEBANK (Bank Nifty)
+        self._yahoo_syms = {}
+        for sym in symbols:
+            y_sym = f"{sym}.NS"
+            if sym == "NIFTY": y_sym = "^NSEI"
+            if sym == "BANKNIFTY": y_sym = "^NSEBANK"
+            self._yahoo_syms[sym] = y_sym
+        self.clients = {}  # websocket -> (outgoing queue, state slots, sender task)
+        self._last_state = {}  # state key -> latest encoded frame, for clients that connect later
         self.pcr_data = {"NIFTY": 1.0, "BANKNIFTY": 1.0}
+        # The data source clients are all blocking - run them in these pools, off the event loop
+        self._pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='bridge-io')
+        self._nse_pool = ThreadPoolExecutor(max_workers=NSE_WORKERS, thread_name_prefix='nse')
+        self._oc_pool = ThreadPoolExecutor(max_workers=OPTION_CHAIN_WORKERS, thread_name_prefix='oc')
+        
+        # One Upstox client for the bridge's lifetime - keeps its HTTPS connections alive between ticks
+        self._upstox_api = None
+        if UPSTOX_AVAILABLE and getattr(config, 'ACCESS_TOKEN', None):
+            self._upstox_cfg = upstox_client.Configuration()
+            self._upstox_cfg.access_token = config.ACCESS_TOKEN
+            self._upstox_cfg.connection_pool_maxsize = IO_WORKERS  # One connection per concurrent fetch
+            self._upstox_api = upstox_client.HistoryV3Api(upstox_client.ApiClient(self._upstox_cfg))
+        
+        # The symbol list is fixed - resolve instrument keys once, not on every tick
+        # (any left unresolved are retried on the next Upstox fetch)
+        self._upstox_keys = {}
+        if self._upstox_api:
+            self._resolve_upstox_keys()
+
+    def _resolve_upstox_keys(self):
+        """
+        Looks up and caches the Upstox instrument key of every symbol not resolved yet.
+        A failing symbol master is logged, not raised - the bridge still starts
+        (TradingView fallback) and the lookup is retried on a later tick.
+        """
+        for sym in self.symbols:
+            if sym in self._upstox_keys:
+                continue
+            try:
+                u_key = SymbolMaster.get_upstox_key(sym)
+            except Exception as e:
+                print(f"[UPSTOX KEYS ERROR] Could not resolve instrument keys: {e}")
+                return
+            if u_key:
+                self._upstox_keys[sym] = u_key
+
+    def _open_clients(self):
+        """(queue, state slots) of every open client; clients no longer open are dropped here."""
+        for websocket, (queue, state, sender) in list(self.clients.items()):
+            if websocket.state != WS_OPEN:
+                # Closing or closed - nothing queued for it would be sent
+                sender.cancel()
+                del self.clients[websocket]
+                continue
+            yield queue, state
+
+    def _broadcast(self, *payloads):
+        """
+        Queues already-encoded messages, in order, for every connected client.
+        
+        Each client's sender task does the actual send, so a broadcast is
+        just a put_nowait per client. A client whose queue is full loses its
+        oldest message instead of stalling the others.
+        """
+        for queue, _ in self._open_clients():
+            for payload in payloads:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(payload)
+
+    def _broadcast_state(self, key, payload):
+        """
+        Sends an already-encoded state message (option chain, breadth) to every client.
+        
+        Not queued: a burst of candle updates could push it out of the
+        drop-oldest queue. Each client keeps only the latest frame per key,
+        which its sender flushes before its next queued message.
+        """
+        self._last_state[key] = payload
+        for queue, state in self._open_clients():
+            state[key] = payload
+            if queue.empty():
+                queue.put_nowait(None)  # Wake an idle sender; a busy one flushes on its next message
+
+    async def _sender_loop(self, websocket, queue, state):
+        """Sends queued messages to one client until it goes away."""
+        # Newer websockets send UTF-8 bytes as a text frame as-is (send(..., text=True))
+        bytes_as_text = 'text' in inspect.signature(websocket.send).parameters
+        try:
+            while True:
+                payload = await queue.get()
+                # Pending state frames (latest per key) go first; a None entry only wakes us
+                payloads = [state.pop(key) for key in list(state)]
+                if payload is not None:
+                    payloads.append(payload)
+                for payload in payloads:
+                    if bytes_as_text:
+                        send = websocket.send(payload, text=True)
+                    else:
+                        send = websocket.send(payload.decode())
+                    await asyncio.wait_for(send, SEND_TIMEOUT)
+        except websockets.ConnectionClosed:
+            pass
+        except asyncio.TimeoutError:
+            print(f"[SEND TIMEOUT] Dropping stalled client {websocket.remote_address}")
+            await websocket.close()
+        except Exception as e:
+            print(f"[SEND ERROR] Dropping client {websocket.remote_address}: {e}")
+            await websocket.close()
+        self.clients.pop(websocket, None)
+
     async def broadcast_option_chain(self):
         """
         Periodically broadcasts Option Chain snapshots from Trendlyne DB.
@@ -95,22 +235,31 @@ class TVCandleBridge:
         loop = asyncio.get_running_loop()
         while True:
             if TrendlyneDB and self.clients and fetch_live_snapshot:
-                for sym in ["NIFTY", "BANKNIFTY"]:
+                ts = int(time.time() * 1000)  # One snapshot time for both symbols
+                symbols = ["NIFTY", "BANKNIFTY"]
+                # run_in_executor to avoid blocking main loop with requests;
+                # the two symbols are independent, so fetch them at the same time.
+                # fetch_live_snapshot saves to DB and returns the chain
+                chains = await asyncio.gather(
+                    *[loop.run_in_executor(self._oc_pool, fetch_live_snapshot, sym) for sym in symbols],
+                    return_exceptions=True
+                )
+                for sym, chain in zip(symbols, chains):
+                    if isinstance(chain, Exception):
+                        print(f"[OCR ERROR] {sym}: {chain}")
+                        continue
                     try:
-                        # run_in_executor to avoid blocking main loop with requests
-                        # fetch_live_snapshot saves to DB and returns the chain
-                        chain = await loop.run_in_executor(None, fetch_live_snapshot, sym)
-                        
                         if chain:
                             # Map to internal format
                             full_sym = "NSE_INDEX|Nifty 50" if sym == "NIFTY" else "NSE_INDEX|Nifty Bank"
                             msg = {
                                 "type": "option_chain",
                                 "symbol": full_sym,
-                                "timestamp": int(time.time() * 1000),
+                                "timestamp": ts,
                                 "data": chain
                             }
-                            await asyncio.gather(*[client.send(json.dumps(msg)) for client in self.clients], return_exceptions=True)
+                            # Encode once, every client gets the same frame
+                            self._broadcast_state(("option_chain", sym), json_dumps(msg))
                     except Exception as e:
                         print(f"[OCR ERROR] {sym}: {e}")
             
@@ -119,11 +268,17 @@ class TVCandleBridge:
     async def broadcast_market_breadth(self):
         """
         Fetches live Adv/Dec from NSE, saves to DB, and broadcasts.
+        Idle (no NSE/TV calls) while no client is connected.
         """
+        loop = asyncio.get_running_loop()
         while True:
+            if not self.clients:
+                await asyncio.sleep(30)
+                continue
+            
             breadth_msg = None
             try:
-                data = self.nse.get_market_breadth()
+                data = await loop.run_in_executor(self._nse_pool, self.nse.get_market_breadth)
                 if data and 'advance' in data:
                     counts = data['advance'].get('count', {})
                     
@@ -143,11 +298,13 @@ class TVCandleBridge:
                 print(f"[BREADTH NSE ERROR] {e}. Trying TV Fallback...")
                 try:
                     # Fallback: Calculate from Nifty 50 stocks using TV Screener
-                    scanner = Query().select('name', 'change').limit(50).get_scanner_data()
-                    rows = scanner[1]
-                    adv = len(rows[rows['change'] > 0])
-                    dec = len(rows[rows['change'] < 0])
-                    unc = len(rows[rows['change'] == 0])
+                    query = Query().select('name', 'change').limit(50)
+                    scanner = await loop.run_in_executor(self._pool, query.get_scanner_data)
+                    # Count on the raw column - no filtered DataFrame per count
+                    chg = scanner[1]['change'].to_numpy()
+                    adv = int((chg > 0).sum())
+                    dec = int((chg < 0).sum())
+                    unc = int((chg == 0).sum())
                     breadth_msg = {
                         "type": "market_breadth",
                         "timestamp": int(time.time() * 1000),
@@ -162,24 +319,31 @@ class TVCandleBridge:
             if breadth_msg:
                 # Persist Snapshot
                 if TrendlyneDB:
-                    d_str = datetime.now().strftime("%Y-%m-%d")
-                    ts_str = datetime.now().strftime("%H:%M")
-                    TrendlyneDB.save_breadth(d_str, ts_str, breadth_msg['data'])
+                    now = datetime.now()
+                    d_str = now.strftime("%Y-%m-%d")
+                    ts_str = now.strftime("%H:%M")
+                    # SQLite write off the event loop
+                    await loop.run_in_executor(self._nse_pool, TrendlyneDB.save_breadth,
+                                               d_str, ts_str, breadth_msg['data'])
 
                 # Broadcast to CLIENTS
-                if self.clients:
-                    await asyncio.gather(*[client.send(json.dumps(breadth_msg)) for client in self.clients], return_exceptions=True)
+                self._broadcast_state("market_breadth", json_dumps(breadth_msg))
             
             await asyncio.sleep(30) # Poll breadth every 30 seconds
 
     async def update_pcr(self):
-        """Periodically updates PCR data from NSE Live API or Trendlyne DB."""
+        """
+        Periodically updates PCR data from NSE Live API or Trendlyne DB.
+        Keeps refreshing while no client is connected (candle packets carry
+        the cached PCR), but only every PCR_IDLE_INTERVAL seconds.
+        """
+        loop = asyncio.get_running_loop()
         while True:
             try:
                 for sym in ["NIFTY", "BANKNIFTY"]:
                     # Try NSE Live API first (v3)
                     try:
-                        data = self.nse.get_option_chain_v3(sym, indices=True)
+                        data = await loop.run_in_executor(self._nse_pool, self.nse.get_option_chain_v3, sym, True)
                         if data and 'records' in data:
                             filtered = data.get('filtered', {})
                             if filtered:
@@ -193,7 +357,8 @@ class TVCandleBridge:
                                     now = datetime.now()
                                     if now.hour == 15 and now.minute >= 25:
                                         if TrendlyneDB:
-                                            TrendlyneDB.save_daily_stats(sym, now.strftime("%Y-%m-%d"), 
+                                            await loop.run_in_executor(self._nse_pool, TrendlyneDB.save_daily_stats,
+                                                                       sym, now.strftime("%Y-%m-%d"),
                                                                        self.pcr_data[sym], ce_oi, pe_oi)
                                     
                                     continue # Skip Trendlyne if NSE is successful
@@ -210,7 +375,7 @@ class TVCandleBridge:
                         self.pcr_data[sym] = 1.0 # Default
             except Exception as e:
                 print(f"PCR Update Error: {e}")
-            await asyncio.sleep(60) # check every minute
+            await asyncio.sleep(60 if self.clients else PCR_IDLE_INTERVAL) # check every minute
 
     async def fetch_candles(self):
         """
@@ -221,10 +386,12 @@ class TVCandleBridge:
             2. TradingView Premium (with cookies) - Fallback
             3. TradingView Public (screener) - Final fallback
         """
+        loop = asyncio.get_running_loop()
+        
         # PRIMARY: Upstox (if available and token valid)
         if UPSTOX_AVAILABLE and hasattr(config, 'ACCESS_TOKEN') and config.ACCESS_TOKEN:
             try:
-                result = self.fetch_candles_upstox_primary()
+                result = await self.fetch_candles_upstox_primary()
                 if result:  # If Upstox returned data successfully
                     return result
                 print("[UPSTOX PRIMARY] No data returned, falling back to TradingView...")
@@ -233,18 +400,18 @@ class TVCandleBridge:
         
         # FALLBACK LEVEL 1: TradingView Premium (with cookies)
         try:
-            return self._fetch_candles_logic(use_cookies=True)
+            return await loop.run_in_executor(self._pool, self._fetch_candles_logic, True)
         except Exception as e:
             print(f"[TV PRIMARY ERROR] {e}. Trying Lightweight Fallback (No Cookies)...")
             try:
                 # FALLBACK LEVEL 2: TradingView Public (no cookies)
-                return self._fetch_candles_logic(use_cookies=False)
+                return await loop.run_in_executor(self._pool, self._fetch_candles_logic, False)
             except Exception as fe:
                 print(f"[TV FALLBACK ERROR] {fe}. Trying Yahoo Finance...")
                 
                 # FALLBACK LEVEL 3: Yahoo Finance
                 try:
-                    return self._fetch_candles_yahoo()
+                    return await loop.run_in_executor(self._pool, self._fetch_candles_yahoo)
                 except Exception as ye:
                     print(f"[YAHOO FALLBACK ERROR] {ye}. All sources exhausted.")
                     return []
@@ -256,20 +423,23 @@ class TVCandleBridge:
             
         print("[FALLBACK] Fetching candles from Yahoo Finance...")
         candles = []
-        ts = int(time.time() // 60 * 60 * 1000)
+        ts = time.time_ns() // 60_000_000_000 * 60_000  # Minute-aligned timestamp (ms)
         
-        # Batch fetching is better but iterating for now to map symbols
-        # Format: RELIANCE.NS, ^NSEI (Nifty), ^NSEBANK (Bank Nifty)
+        y_syms = self._yahoo_syms
         
-        for sym in self.symbols:
-            y_sym = f"{sym}.NS"
-            if sym == "NIFTY": y_sym = "^NSEI"
-            if sym == "BANKNIFTY": y_sym = "^NSEBANK"
-            
+        # Fetch 1 day, 1m interval for all symbols in one batched download
+        # (yfinance spreads the tickers over its own threads)
+        df_all = yf.download(" ".join(y_syms.values()), period="1d", interval="1m",
+                             group_by='ticker', threads=True, progress=False)
+        if df_all is None or df_all.empty:
+            return []
+        # A single ticker comes back without the per-ticker column level
+        multi = isinstance(df_all.columns, pd.MultiIndex)
+        
+        for sym, y_sym in y_syms.items():
             try:
-                ticker = yf.Ticker(y_sym)
-                # Fetch 1 day, 1m interval
-                df = ticker.history(period="1d", interval="1m")
+                # Rows are the union of all tickers' minutes - drop this ticker's gaps
+                df = (df_all[y_sym] if multi else df_all).dropna()
                 if df.empty: continue
                 
                 last_row = df.iloc[-1]
@@ -297,72 +467,28 @@ class TVCandleBridge:
                 
         return candles
 
-    def fetch_candles_upstox_primary(self):
-        """PRIMARY: Fetch latest intraday candles using Upstox HistoryV3 API."""
-        if not UPSTOX_AVAILABLE or not config.ACCESS_TOKEN:
+    async def fetch_candles_upstox_primary(self):
+        """PRIMARY: Fetch latest intraday candles using Upstox HistoryV3 API (all symbols concurrently)."""
+        if not self._upstox_api:
             print("[CRITICAL] Upstox Fallback unavailable (No Token/SDK).")
             return []
         
-        upstox_candles = []
         try:
-            configuration = upstox_client.Configuration()
-            configuration.access_token = config.ACCESS_TOKEN
-            api_client = upstox_client.ApiClient(configuration)
-            history_api = upstox_client.HistoryV3Api(api_client) # Use HistoryV3Api
+            history_api = self._upstox_api
+            ts = time.time_ns() // 60_000_000_000 * 60_000  # Minute-aligned timestamp (ms)
             
-            ts = int(time.time() // 60 * 60 * 1000)
+            loop = asyncio.get_running_loop()
+            if len(self._upstox_keys) < len(self.symbols):
+                # Some keys still unresolved (e.g. symbol master was unavailable) - retry, off the loop
+                await loop.run_in_executor(self._pool, self._resolve_upstox_keys)
             
-            for sym in self.symbols:
-                u_key = SymbolMaster.get_upstox_key(sym)
-                if not u_key: continue
-                
-                try:
-                    # Fetch Intraday Data (Current Day)
-                    # Verified Signature: (instrument_key, unit="minutes", interval="1")
-                    response = history_api.get_intra_day_candle_data(u_key, "minutes", "1")
-                    
-                    if response and hasattr(response, 'data') and hasattr(response.data, 'candles'):
-                        candles = response.data.candles
-                        if not candles: continue
-                        
-                        # Use the latest candle
-                        # Format: [timestamp, open, high, low, close, volume, oi]
-                        # Verify sort order: Upstox typically returns ascending (last item is latest) or descending?
-                        # Usually logic: check timestamp of index 0 vs -1.
-                        # Assuming index 0 is latest for now based on typical API, but safe to check.
-                        # Actually standard for Upstox V3 is reversed? Let's check dates.
-                        # Safest: Sort by timestamp
-                        
-                        sorted_candles = sorted(candles, key=lambda x: x[0], reverse=True)
-                        last_candle = sorted_candles[0]
-                        
-                        # Parse
-                        # [ "2024-01-01T09:15:00+05:30", 100.0, 105.0, 99.0, 102.0, 5000, 0]
-                        # Timestamp likely iso string in V3 response
-                        
-                        ltp = float(last_candle[4]) # Close
-                        op = float(last_candle[1])
-                        hi = float(last_candle[2])
-                        lo = float(last_candle[3])
-                        vol = int(last_candle[5])
-                        
-                        # Create Candle Packet
-                        c_data = {
-                            "symbol": sym, "timestamp": ts,
-                            "1m": {
-                                "open": op, "high": hi, "low": lo, "close": ltp, "volume": vol,
-                                "vwap": ltp # Approximation
-                            },
-                            "5m": { 
-                                 "open": op, "high": hi, "low": lo, "close": ltp, "volume": vol
-                            },
-                            "pcr": self.pcr_data.get(sym, 1.0)
-                        }
-                        upstox_candles.append(c_data)
-
-                except Exception as inner_e:
-                     # print(f"[UPSTOX INNER ERROR] {sym}: {inner_e}")
-                     continue
+            # The symbols don't depend on each other - one request per symbol, all in flight at once
+            results = await asyncio.gather(
+                *[loop.run_in_executor(self._pool, self._fetch_one_upstox, history_api, sym, u_key, ts)
+                  for sym, u_key in self._upstox_keys.items()],
+                return_exceptions=True
+            )
+            upstox_candles = [c for c in results if c and not isinstance(c, BaseException)]
                 
             if upstox_candles:
                  print(f"[UPSTOX PRIMARY] Recovered {len(upstox_candles)} symbols.")
@@ -372,38 +498,88 @@ class TVCandleBridge:
             print(f"[CRITICAL] Upstox Primary Failed: {e}")
             return []
 
+    def _fetch_one_upstox(self, history_api, sym, u_key, ts):
+        """Fetches the latest intraday candle of one symbol; returns the candle packet or None."""
+        try:
+            # Fetch Intraday Data (Current Day)
+            # Verified Signature: (instrument_key, unit="minutes", interval="1")
+            response = history_api.get_intra_day_candle_data(u_key, "minutes", "1")
+            
+            if response and hasattr(response, 'data') and hasattr(response.data, 'candles'):
+                candles = response.data.candles
+                if not candles: return None
+                
+                # Use the latest candle
+                # Format: [timestamp, open, high, low, close, volume, oi]
+                # Verify sort order: Upstox typically returns ascending (last item is latest) or descending?
+                # Usually logic: check timestamp of index 0 vs -1.
+                # Assuming index 0 is latest for now based on typical API, but safe to check.
+                # Actually standard for Upstox V3 is reversed? Let's check dates.
+                # Safest: pick the max timestamp (one pass, no sorted copy)
+                
+                last_candle = max(candles, key=itemgetter(0))
+                
+                # Parse
+                # [ "2024-01-01T09:15:00+05:30", 100.0, 105.0, 99.0, 102.0, 5000, 0]
+                # Timestamp likely iso string in V3 response
+                
+                ltp = float(last_candle[4]) # Close
+                op = float(last_candle[1])
+                hi = float(last_candle[2])
+                lo = float(last_candle[3])
+                vol = int(last_candle[5])
+                
+                # Create Candle Packet
+                return {
+                    "symbol": sym, "timestamp": ts,
+                    "1m": {
+                        "open": op, "high": hi, "low": lo, "close": ltp, "volume": vol,
+                        "vwap": ltp # Approximation
+                    },
+                    "5m": { 
+                         "open": op, "high": hi, "low": lo, "close": ltp, "volume": vol
+                    },
+                    "pcr": self.pcr_data.get(sym, 1.0)
+                }
+
+        except Exception as inner_e:
+             # print(f"[UPSTOX INNER ERROR] {sym}: {inner_e}")
+             pass
+        return None
+
     def _fetch_candles_logic(self, use_cookies=True):
         """Standardized candle fetching logic for both primary and fallback paths."""
         scanner_query = Query().select(
-            'name', 
-            'open|1', 'high|1', 'low|1', 'close|1', 'volume|1',
-            'open|5', 'high|5', 'low|5', 'close|5', 'volume|5',
-            'VWAP|1'
+            *CANDLE_COLUMNS, 'VWAP|1'
         ).set_tickers(*self.tickers).get_scanner_data(cookies=cookies if use_cookies else None)
         
         candles = []
         if len(scanner_query) > 1:
-            ts = int(time.time() // 60 * 60 * 1000) # Minute-aligned timestamp
-            for _, row in scanner_query[1].iterrows():
-                sym = row['name'].split(':')[-1]
+            ts = time.time_ns() // 60_000_000_000 * 60_000 # Minute-aligned timestamp
+            df = scanner_query[1]
+            # Walk the columns side by side - no per-row Series; tolist() gives plain Python numbers
+            columns = [df[c].tolist() for c in CANDLE_COLUMNS]
+            vwaps = df['VWAP|1'].tolist() if 'VWAP|1' in df else columns[4]
+            for name, o1, h1, l1, c1, v1, o5, h5, l5, c5, v5, vwap in zip(*columns, vwaps):
+                sym = name.split(':')[-1]
                 
                 candle_data = {
                     "symbol": sym,
                     "timestamp": ts,
                     "1m": {
-                        "open": row['open|1'],
-                        "high": row['high|1'],
-                        "low": row['low|1'],
-                        "close": row['close|1'],
-                        "volume": row['volume|1'],
-                        "vwap": row.get('VWAP|1', row['close|1']), # Fallback
+                        "open": o1,
+                        "high": h1,
+                        "low": l1,
+                        "close": c1,
+                        "volume": v1,
+                        "vwap": vwap if vwap == vwap else c1, # Fallback (NaN != NaN)
                     },
                     "5m": {
-                        "open": row['open|5'],
-                        "high": row['high|5'],
-                        "low": row['low|5'],
-                        "close": row['close|5'],
-                        "volume": row['volume|5'],
+                        "open": o5,
+                        "high": h5,
+                        "low": l5,
+                        "close": c5,
+                        "volume": v5,
                     },
                     "pcr": self.pcr_data.get(sym, 1.0)
                 }
@@ -417,16 +593,20 @@ class TVCandleBridge:
             if self.clients:
                 data = await self.fetch_candles()
                 if data:
-                    message = json.dumps({"type": "candle_update", "data": data})
-                    # Use gather to send to all clients
-                    await asyncio.gather(*[client.send(message) for client in self.clients], return_exceptions=True)
+                    self._broadcast(json_dumps({"type": "candle_update", "data": data}))
             
             # Since we want "1 min candles", we poll every 10 seconds 
             # to catch the update as soon as the candle matures or price changes
             await asyncio.sleep(10)
 
     async def handler(self, websocket, path=None):
-        self.clients.add(websocket)
+        queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        # Chain and breadth refresh every 30-60s - bring the new client up to date now
+        state = dict(self._last_state)
+        if state:
+            queue.put_nowait(None)  # Wake the sender to flush the state slots
+        sender = asyncio.create_task(self._sender_loop(websocket, queue, state))
+        self.clients[websocket] = (queue, state, sender)
         print(f"Client connected: {websocket.remote_address}. Total: {len(self.clients)}")
         try:
             async for message in websocket:
@@ -434,12 +614,15 @@ class TVCandleBridge:
         except websockets.ConnectionClosed:
             pass
         finally:
-            self.clients.remove(websocket)
+            sender.cancel()
+            self.clients.pop(websocket, None)
             print(f"Client disconnected. Total: {len(self.clients)}")
 
     async def main_loop(self):
         """Starts the WebSocket server and concurrent tasks."""
-        async with websockets.serve(self.handler, "localhost", PORT):
+        # No permessage-deflate: every client gets the same payloads, and a
+        # deflate context per connection would compress each one N times
+        async with websockets.serve(self.handler, "localhost", PORT, compression=None):
             print(f"TV Candle Bridge started on ws://localhost:{PORT}")
             # Run broadcast and update_pcr concurrently
             await asyncio.gather(
@@ -452,7 +635,7 @@ class TVCandleBridge:
     def run(self):
         """Entry point for the bridge."""
         try:
-            asyncio.run(self.main_loop())
+            run_event_loop(self.main_loop())
         except KeyboardInterrupt:
             print("\nServer shutting down...")
         except Exception as e: